@@ -13,9 +13,12 @@
     and Gtk instead of pygame.
 
 """
-import os
 import cairo
+import io
 import logging
+import math
+import time
+from collections import OrderedDict
 
 from gi.repository import Gdk
 from gi.repository import GObject
@@ -24,37 +27,63 @@ from gi.repository import PangoCairo
 
 from sugar3.graphics import style
 
-from sprites import Sprites, Sprite
-
-# artwork positions/scale in [landscape, portrait]
-BS = [400, 400]  # box scale
-X1 = [25, 25]  # left/top box position
-Y1 = [25, 25]
-X2 = [475, 25]  # right/bottom box position
-Y2 = [25, 475]
-NX = [475, 475]  # number cards position
-NY = [475, 475]
-NS = [75, 75]  # number cards size
-NO = [7, 7]  # offset between number cards
-TX = [200, 225]  # target turtle position
-TY = [350, 350]
-TS = [50, 50]  # target turtle line length
-UX = [650, 225]  # user turtle position
-UY = [350, 775]
-US = [50, 50]  # user turtle line length
-GY = [500, 950]  # position of success/failure graphics
-LS = [24, 24]  # font size for level indicator
+from sprites import Sprites, Sprite, surface_use
+from hud import PerfHud
+from hints import HintIndex
+from quality import QualityGovernor
+import quality
+from history import History
+import history
+from timeline import Timeline
+import spirocore
+from spirocore import MAX_DIGIT
+import tracing
 
 NUMBER_LAYER = 10
 TURTLE_LAYER = 6
 SUCCESS_LAYER = 5
 HIDDEN_LAYER = 0
 
+MATCHED_COLOR = [0, 192, 0]  # segment diff colors
+MISSING_COLOR = [255, 255, 255]
+EXTRA_COLOR = [255, 0, 0]
+
+HINT_MS = 1500  # how long a hinted card glows
+GLOW_COLOR = '#FFFFFF'  # digits of the card being drawn
+CARD_SETS = 8  # sizes of number card images kept
+COMPARE = 3  # recent attempts run side by side by do_compare()
+COMPARE_COLORS = [[255, 160, 0], [0, 200, 255], [255, 96, 255],
+                  [160, 255, 64]]
+
+
+class MainLoopScheduler:
+    ''' Timeouts on the GLib main loop (see simulation.VirtualScheduler) '''
+
+    def timeout_add(self, delay, callback, *args):
+        return GObject.timeout_add(delay, callback, *args)
+
+    def idle_add(self, callback, *args):
+        return GObject.idle_add(callback, *args)
+
+    def source_remove(self, source):
+        return GObject.source_remove(source)
+
 
 class Spirolaterals:
 
     def __init__(self, canvas, colors, parent, score=0, delay=500, pattern=1,
-                 last=None):
+                 last=None, startup=None, scheduler=None, mode=None,
+                 screen=None):
+        if startup is None:
+            startup = tracing.PhaseTimer('game startup')
+        self._startup = startup
+        if scheduler is None:
+            scheduler = MainLoopScheduler()
+        self._scheduler = scheduler
+        if mode is None:
+            mode = spirocore.Mode()
+        self._mode = mode
+        self._screen = screen  # (width, height); Gdk.Screen's if None
         self._canvas = canvas
         self._colors = colors
         self._parent = parent
@@ -62,16 +91,49 @@ class Spirolaterals:
         self.score = score
         self.pattern = pattern
         self.last_pattern = last
-        self._running = False
+        self._player = None
+        self._timeline = None
+        self._hints = HintIndex()
+        self._hint = None  # (index, digit, timeout source) being shown
+        self._hints_source = None  # idle callback building a hint row
+        self._compare = []  # (program, tile, color) of a comparison
+        self._compare_steps = []  # segments drawn so far in each tile
+        self._compare_pen = 4
+        self._next_level = None  # (key, pattern, goal, starts, canvas, cr)
+        self._prefetch_source = None  # idle callback preparing it
+        self._prefetch_pieces = None  # _prepare_level() generator
+        self.history = History()
+        self._goal_shown = time.time()
+        self._attempt = None  # (program, ms on the pattern) being run
 
         self._turtle_canvas = None
-        self._user_numbers = [1, 1, 1, 3, 2]
+        self._canvas_scale = 1.  # turtle canvas pixels per canvas unit
+        self._canvas_version = 0  # bumped whenever the canvas is drawn on
+        self._preview = None  # (version, size, PNG data)
+        if mode.classic():
+            self._user_numbers = [1, 1, 1, 3, 2]
+        else:
+            self._user_numbers = [1] * mode.length
+        self._shown_numbers = list(self._user_numbers)  # on the sprites
+        self._numbers_source = None  # idle callback to update them
         self._active_index = 0
+        self._hud = PerfHud()
+        self._hud_source = None
+        self._visible = True  # False while the activity can't be seen
+        self.quality = QualityGovernor()
+        self.memory_budget = None  # bytes of surfaces; see check_memory()
+        self.memory_peak = 0
+        self.memory_total = 0  # bytes found by the last memory()
+        self._painted = True  # a frame has shown the turtle's last move
+        self._layouts = {}  # (width, height): spirocore.Layout
+        self._card_images = OrderedDict()  # size: (base, mask) pairs, LRU
+        self._card_size = None
 
         self._sprites = Sprites(self._canvas)
         self._sprites.set_delay(True)
 
-        size = max(Gdk.Screen.width(), Gdk.Screen.height())
+        size = max(self._screen_size())
+        self._canvas_size = size
 
         cr = self._canvas.get_property('window').cairo_create()
         self._turtle_canvas = cr.get_target().create_similar(
@@ -81,6 +143,7 @@ class Spirolaterals:
         self._cr = cairo.Context(self._turtle_canvas)
         self._cr.set_line_cap(1)  # Set the line cap to be round
         self._sprites.set_cairo_context(self._cr)
+        self._startup.mark('turtle canvas')
 
         self._canvas.set_can_focus(True)
         self._canvas.grab_focus()
@@ -90,49 +153,74 @@ class Spirolaterals:
         self._canvas.connect('button-press-event', self._button_press_cb)
         self._canvas.connect('key_press_event', self._keypress_cb)
 
-        self._width = Gdk.Screen.width()
-        self._height = Gdk.Screen.height() - style.GRID_CELL_SIZE
-
-        if self._width < self._height:
-            self.i = 1
-        else:
-            self.i = 0
-
+        self._width, height = self._screen_size()
+        self._height = height - style.GRID_CELL_SIZE
         self._calculate_scale_and_offset()
 
-        self._numbers = []
-        self._glownumbers = []
-        self._create_number_sprites()
+        # Only what the first frame shows is built here: the glow
+        # cards, the other turtle headings, the splot and the result
+        # banners follow in an idle callback (or on first use).
+        # The cards and turtles start out as placeholders and get
+        # their images as the parent's asset workers finish them.
+        self._deferred_done = False
+        self._numbers = self._request_number_sprites(
+            self._parent.card_color())
+        self._startup.mark('number cards')
         self._create_turtle_sprites()
-        self._create_results_sprites()
+        self._startup.mark('turtles')
 
         self._set_color(colors[0])
         self._set_pen_size(4)
 
         self.reset_level()
+        self._startup.mark('level')
+        self._scheduler.idle_add(self._create_deferred_sprites)
+
+    def _create_deferred_sprites(self):
+        ''' Build the sprites the first frame doesn't need '''
+        if self._deferred_done:
+            return False
+        self._glownumbers = self._create_glow_sprites()
+        self._create_turtle_headings()
+        self._splot = self._tinted_sprite(0, 0, self._parent.splot_images(),
+                                          self._parent.sugarcolors[0])
+        self._splot.type = 'splot'
+        self._splot.hide()
+        self._create_results_sprites()
+        self._deferred_done = True
+        self.check_memory()
+        self._startup.mark('deferred sprites')
+        self._startup.report()
+        return False
+
+    def _ensure_deferred_sprites(self):
+        if not self._deferred_done:
+            self._create_deferred_sprites()
 
     def _calculate_scale_and_offset(self):
-        self.offset = 0
-        if self.i == 0:
-            self.scale = self._height / (900. - style.GRID_CELL_SIZE) * 1.25
-            self.offset = (self._width -
-                           (self.sx(X1[self.i] + X2[self.i]) +
-                            self.ss(BS[self.i]))) / 2.
-        else:
-            self.scale = self._width / 900.
-            self.offset = (self._width -
-                           (self.sx(X1[self.i]) +
-                            self.ss(BS[self.i]))) / 2.
+        key = (self._width, self._height)
+        if key not in self._layouts:
+            self._layouts[key] = spirocore.Layout(
+                self._width, self._height, style.GRID_CELL_SIZE)
+        self._layout = self._layouts[key]
+        self.i = self._layout.i
+        self.scale = self._layout.scale
+        self.offset = self._layout.offset
+
+    def _screen_size(self):
+        if self._screen is not None:
+            return self._screen
+        return Gdk.Screen.width(), Gdk.Screen.height()
 
     def reset_level(self):
-        self._width = Gdk.Screen.width()
-        self._height = Gdk.Screen.height() - style.GRID_CELL_SIZE
-        if self._width < self._height:
-            self.i = 1
-        else:
-            self.i = 0
-
+        self._width, height = self._screen_size()
+        self._height = height - style.GRID_CELL_SIZE
         self._calculate_scale_and_offset()
+        self._hud.move(self._width - PerfHud.WIDTH, 0)
+        self._clear_timeline()
+        self._cancel_prefetch()
+        if self._card_size != self._layout.card_size(self._mode.length):
+            self._rescale_cards()
 
         self._show_background_graphics()
         self._show_user_numbers()
@@ -144,39 +232,50 @@ class Spirolaterals:
 
         if self.score > 0:
             self._parent.update_score(int(self.score))
+        self.check_memory()
 
     def _reset_sprites(self):
-        x = self.sx(TX[self.i] - TS[self.i] / 2)
-        y = self.sy(TY[self.i])
-        self._target_turtle.move((x, y))
-
-        x = self.sx(UX[self.i] - US[self.i] / 2)
-        y = self.sy(UY[self.i])
-        self._user_turtles[0].move((x, y))
-
-        for i in range(5):
-            for j in range(5):
-                if self.i == 0:
-                    x = self.sx(NX[self.i]) + i * (self.ss(NS[self.i]
-                                                           + NO[self.i]))
-                    y = self.sy(NY[self.i])
-                else:
-                    x = self.sx(NX[self.i])
-                    y = self.sy(NY[self.i]) + i * (self.ss(NS[self.i]
-                                                           + NO[self.i]))
-                self._numbers[i][j].move((x, y))
-                self._glownumbers[i][j].move((x, y))
+        x, y, dd = self._target_start
+        self._target_turtle.move((int(x - dd / 2), y))
 
-        x = 0
-        y = self.sy(GY[self.i])
-        self._success.move((x, y))
-        self._success.hide()
-        self._failure.move((x, y))
-        self._failure.hide()
-        self._splot.hide()
+        self._reset_user_turtle()
 
-        if self.last_pattern == self.pattern:
+        for i in range(self._mode.length):
+            x, y = self._number_position(i)
+            for j in range(MAX_DIGIT):
+                self._numbers[i][j].move((x, y))
+                if self._deferred_done:
+                    self._glownumbers[i][j].move((x, y))
+
+        if self._deferred_done:
+            x = 0
+            y = self._layout.results_y
+            self._success.move((x, y))
+            self._failure.move((x, y))
+        self._hide_results()
+        self._show_solved()
+
+    def _solved(self):
+        ''' Patterns solved in this mode
+
+        Journal entries from before the history only kept the last
+        pattern solved, which counts as well in the classic mode, the
+        only one they knew.
+        '''
+        solved = self.history.solved(self._mode.angle, self._mode.length)
+        if self._mode.classic() and self.last_pattern is not None:
+            solved.add(self.last_pattern)
+        return solved
+
+    def _show_solved(self):
+        ''' Let the student move on from a pattern solved before '''
+        if self.pattern in self._solved():
             self._parent.cyan.set_sensitive(True)
+        return False
+
+    def history_loaded(self):
+        ''' The Journal's attempts arrived after the level was shown '''
+        self._scheduler.idle_add(self._show_solved)
 
     def _keypress_cb(self, area, event):
         ''' Keypress: moving the slides with the arrow keys '''
@@ -184,44 +283,39 @@ class Spirolaterals:
         k = Gdk.keyval_name(event.keyval)
         if k in ['1', '2', '3', '4', '5']:
             self.do_stop()
-            i = self._active_index
-            j = int(k) - 1
-            self._numbers[i][self._user_numbers[i] - 1].set_layer(HIDDEN_LAYER)
-            self._numbers[i][j].set_layer(NUMBER_LAYER)
-            self._user_numbers[i] = j + 1
-            self.inval(self._numbers[i][j].rect)
+            self._set_number(self._active_index, int(k))
         elif k in ['KP_Up', 'j', 'Up']:
             self.do_stop()
             i = self._active_index
-            j = self._user_numbers[i]
-            if j < 5:
-                j += 1
-            self._numbers[i][self._user_numbers[i] - 1].set_layer(HIDDEN_LAYER)
-            self._numbers[i][j - 1].set_layer(NUMBER_LAYER)
-            self._user_numbers[i] = j
-            self.inval(self._numbers[i][j].rect)
+            self._set_number(i, min(self._user_numbers[i] + 1, MAX_DIGIT))
         elif k in ['KP_Down', 'k', 'Down']:
             self.do_stop()
             i = self._active_index
-            j = self._user_numbers[i]
-            if j > 0:
-                j -= 1
-            self._numbers[i][self._user_numbers[i] - 1].set_layer(HIDDEN_LAYER)
-            self._numbers[i][j - 1].set_layer(NUMBER_LAYER)
-            self._user_numbers[i] = j
-            self.inval(self._numbers[i][j].rect)
+            self._set_number(i, max(self._user_numbers[i] - 1, 1))
         elif k in ['KP_Left', 'h', 'Left']:
             self.do_stop()
             self._active_index -= 1
-            self._active_index %= 5
+            self._active_index %= self._mode.length
         elif k in ['KP_Right', 'l', 'Right']:
             self.do_stop()
             self._active_index += 1
-            self._active_index %= 5
+            self._active_index %= self._mode.length
         elif k in ['Return', 'KP_Page_Up', 'KP_End']:
             self.do_run()
         elif k in ['space', 'Esc', 'KP_Page_Down', 'KP_Home']:
             self.do_stop()
+        elif k == 'bracketleft':
+            if self._timeline is not None:
+                self.do_scrub(self._timeline.position - 1)
+        elif k == 'bracketright':
+            if self._timeline is not None:
+                self.do_scrub(self._timeline.position + 1)
+        elif k in ['question', 'F1']:
+            self.do_hint()
+        elif k == 'c':
+            self.do_compare()
+        elif k == 'F9':
+            self._toggle_hud()
         else:
             logging.debug(k)
 
@@ -232,139 +326,310 @@ class Spirolaterals:
         win.grab_focus()
         x, y = map(int, event.get_coords())
         self.press = self._sprites.find_sprite((x, y))
-        if self.press is not None and self.press.type == 'number':
-            self.do_stop()
-            i = int(self.press.name.split(',')[0])
-            self._active_index = i
-            j = int(self.press.name.split(',')[1])
-            j1 = (j + 1) % 5
-            self._numbers[i][j1].set_layer(NUMBER_LAYER)
-            self._numbers[i][j].set_layer(HIDDEN_LAYER)
-            self._user_numbers[i] = j1 + 1
-            self.inval(self._numbers[i][j].rect)
+        if self.press is None or self.press.type not in ['number', 'glow']:
+            return
+        hint = self._hint
+        self.do_stop()
+        i = int(self.press.name.split(',')[0])
+        self._active_index = i
+        if self.press.type == 'glow' and hint is not None and hint[0] == i:
+            self._set_number(i, hint[1])  # take the hint
+        else:  # glow cards show a hint or a run, not the user's number
+            self._set_number(i, self._user_numbers[i] % MAX_DIGIT + 1)
 
     def _create_results_sprites(self):
         x = 0
-        y = self.sy(GY[self.i])
-        self._success = Sprite(self._sprites, x, y,
-                               self._parent.good_job_pixbuf())
+        y = self._layout.results_y
+        self._success = self._tinted_sprite(x, y,
+                                            self._parent.good_job_images(),
+                                            self._parent.sugarcolors[0])
+        self._success.type = 'result'
         self._success.hide()
-        self._failure = Sprite(self._sprites, x, y,
-                               self._parent.try_again_pixbuf())
+        self._failure = self._tinted_sprite(x, y,
+                                            self._parent.try_again_images(),
+                                            self._parent.sugarcolors[0])
+        self._failure.type = 'result'
         self._failure.hide()
 
+    def _hide_results(self):
+        if self._deferred_done:
+            self._success.hide()
+            self._failure.hide()
+            self._splot.hide()
+
     def _create_turtle_sprites(self):
-        x = self.sx(TX[self.i] - TS[self.i] / 2)
-        y = self.sy(TY[self.i])
-        pixbuf = self._parent.turtle_pixbuf()
-        self._target_turtle = Sprite(self._sprites, x, y, pixbuf)
+        placeholder = cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1)
+        x, y, dd = self._layout.target_start()
+        self._target_turtle = Sprite(self._sprites, int(x - dd / 2), y,
+                                     placeholder)
         self._user_turtles = []
-        x = self.sx(UX[self.i] - US[self.i] / 2)
-        y = self.sy(UY[self.i])
-        self._user_turtles.append(Sprite(self._sprites, x, y, pixbuf))
-        pixbuf = pixbuf.rotate_simple(270)
-        self._user_turtles.append(Sprite(self._sprites, x, y, pixbuf))
-        pixbuf = pixbuf.rotate_simple(270)
-        self._user_turtles.append(Sprite(self._sprites, x, y, pixbuf))
-        pixbuf = pixbuf.rotate_simple(270)
-        self._user_turtles.append(Sprite(self._sprites, x, y, pixbuf))
+        x, y, dd = self._layout.user_start()
+        self._user_turtles.append(Sprite(self._sprites, int(x - dd / 2), y,
+                                         placeholder))
+        self._target_turtle.type = 'turtle'
+        self._user_turtles[0].type = 'turtle'
         self._show_turtle(0)
-        self._splot = Sprite(self._sprites, 0, 0, self._parent.splot_pixbuf())
-        self._splot.hide()
+        self._parent.turtle_images(self._turtle_arrived)
+
+    def _turtle_arrived(self, images):
+        color = self._parent.sugarcolors[0]
+        self._set_images(self._target_turtle, images, color)
+        self._set_images(self._user_turtles[0], images, color)
+
+    def _create_turtle_headings(self):
+        ''' A turtle for every other heading the mode can reach '''
+        x, y = self._user_turtles[0].get_xy()
+        base, mask = self._parent.turtle_images()
+        for h in range(1, self._mode.headings()):
+            degrees = h * self._mode.angle % 360
+            turtle = self._tinted_sprite(
+                x, y, (_rotate(base, degrees), _rotate(mask, degrees)),
+                self._parent.sugarcolors[0])
+            turtle.type = 'turtle'
+            turtle.hide()
+            self._user_turtles.append(turtle)
 
     def _show_splot(self, x, y, dd, h):
-        for i in range(4):
-            self._user_turtles[i].hide()
-        if h == 0:
-            self._splot.move((x - int(dd / 2), y))
-        elif h == 1:
-            self._splot.move((x - dd, y - int(dd / 2)))
-        elif h == 2:
-            self._splot.move((x - int(dd / 2), y - dd))
-        elif h == 3:
-            self._splot.move((x, y - int(dd / 2)))
+        for turtle in self._user_turtles:
+            turtle.hide()
+        dx, dy = spirocore.turn_table(self._mode.angle)[h]
+        self._splot.move((int(x - dx * dd / 2. - dd / 2.),
+                          int(y - dy * dd / 2. - dd / 2.)))
         self._splot.set_layer(SUCCESS_LAYER)
         self._failure.set_layer(SUCCESS_LAYER)
 
     def _show_turtle(self, t):
-        for i in range(4):
+        for i, turtle in enumerate(self._user_turtles):
             if i == t:
-                self._user_turtles[i].set_layer(TURTLE_LAYER)
+                turtle.set_layer(TURTLE_LAYER)
             else:
-                self._user_turtles[i].hide()
+                turtle.hide()
 
     def _reset_user_turtle(self):
-        x = self.sx(UX[self.i] - US[self.i] / 2)
-        y = self.sy(UY[self.i])
-        self._user_turtles[0].move((x, y))
+        x, y, dd = self._user_start
+        self._user_turtles[0].move((int(x - dd / 2), y))
         self._show_turtle(0)
 
-    def _create_number_sprites(self):
-        for i in range(5):
-            self._numbers.append([])
-            self._glownumbers.append([])
-            for j in range(5):
-                if self.i == 0:
-                    x = self.sx(NX[self.i]) + i * (self.ss(NS[self.i]
-                                                           + NO[self.i]))
-                    y = self.sy(NY[self.i])
-                else:
-                    x = self.sx(NX[self.i])
-                    y = self.sy(NY[self.i]) + i * (self.ss(NS[self.i]
-                                                           + NO[self.i]))
-                number = Sprite(
-                    self._sprites, x, y,
-                    self._parent.number_pixbuf(self.ss(NS[self.i]), j + 1,
-                                              self._parent.sugarcolors[1]))
+    def _number_position(self, i):
+        return self._layout.card_positions(self._mode.length)[i]
+
+    def _tinted_sprite(self, x, y, images, color):
+        ''' A sprite from a (base, mask) pair, drawn in color '''
+        base, mask = images
+        sprite = Sprite(self._sprites, x, y, base)
+        sprite.set_mask(mask, color)
+        return sprite
+
+    def _set_images(self, sprite, images, color):
+        ''' Give a placeholder sprite its (base, mask) pair '''
+        sprite.set_image(images[0])
+        sprite.set_mask(images[1], color)
+        self.inval(sprite.rect)
+
+    def _number_images(self):
+        ''' (base, mask) of cards 1 to 5 at the current card size '''
+        size = self._layout.card_size(self._mode.length)
+        if size in self._card_images:
+            images = self._card_images.pop(size)
+        else:
+            images = [self._parent.number_images(size, j + 1)
+                      for j in range(MAX_DIGIT)]
+        self._card_images[size] = images  # most recently used
+        while len(self._card_images) > CARD_SETS:
+            self._card_images.popitem(last=False)
+        return images
+
+    def _rescale_cards(self):
+        ''' Swap in the card images for the current layout '''
+        self._card_size = self._layout.card_size(self._mode.length)
+        images = self._number_images()
+        card_sets = [(self._numbers, self._parent.card_color())]
+        if self._deferred_done:
+            card_sets.append((self._glownumbers, GLOW_COLOR))
+        for numbers, color in card_sets:
+            for cards in numbers:
+                for j, card in enumerate(cards):
+                    card.set_image(images[j][0])
+                    card.set_mask(images[j][1], color)
+
+    def _create_number_sprites(self, color):
+        numbers = []
+        images = self._number_images()
+        self._card_size = self._layout.card_size(self._mode.length)
+        for i in range(self._mode.length):
+            numbers.append([])
+            x, y = self._number_position(i)
+            for j in range(MAX_DIGIT):
+                number = self._tinted_sprite(x, y, images[j], color)
                 number.type = 'number'
                 number.name = '%d,%d' % (i, j)
-                self._numbers[i].append(number)
-
-                number = Sprite(
-                    self._sprites, x, y,
-                    self._parent.number_pixbuf(self.ss(NS[self.i]), j + 1,
-                                              '#FFFFFF'))
+                numbers[i].append(number)
+        return numbers
+
+    def _request_number_sprites(self, color):
+        ''' Number cards shown blank until their digits are rasterized '''
+        size = self._layout.card_size(self._mode.length)
+        self._card_size = size
+        blank = _blank_card(size)
+        numbers = []
+        for i in range(self._mode.length):
+            numbers.append([])
+            x, y = self._number_position(i)
+            for j in range(MAX_DIGIT):
+                number = Sprite(self._sprites, x, y, blank)
                 number.type = 'number'
                 number.name = '%d,%d' % (i, j)
-                self._glownumbers[i].append(number)
+                numbers[i].append(number)
+        for j in range(MAX_DIGIT):
+            self._parent.number_images(
+                size, j + 1, lambda images, j=j: self._card_arrived(
+                    numbers, size, j, images, color))
+        return numbers
+
+    def _card_arrived(self, numbers, size, j, images, color):
+        if size != self._card_size:
+            return  # the cards have been rescaled in the meantime
+        for cards in numbers:
+            self._set_images(cards[j], images, color)
+
+    def _create_glow_sprites(self):
+        glownumbers = self._create_number_sprites(GLOW_COLOR)
+        for cards in glownumbers:
+            for card in cards:
+                card.type = 'glow'
+                card.hide()
+        return glownumbers
+
+    def _set_number(self, i, n):
+        ''' Put n on card i; the sprites follow in _flush_numbers() '''
+        self._user_numbers[i] = n
+        if self._numbers_source is None:
+            self._numbers_source = self._scheduler.idle_add(
+                self._flush_numbers)
+
+    def _flush_numbers(self):
+        ''' Show the cards whose numbers changed since the last frame '''
+        if self._numbers_source is not None:
+            self._scheduler.source_remove(self._numbers_source)
+            self._numbers_source = None
+        for i, n in enumerate(self._user_numbers):
+            shown = self._shown_numbers[i]
+            if n != shown:
+                self._numbers[i][shown - 1].set_layer(HIDDEN_LAYER)
+                self._numbers[i][n - 1].set_layer(NUMBER_LAYER)
+                self._shown_numbers[i] = n
+                self.inval(self._numbers[i][n - 1].rect)
+        return False
 
     def _show_user_numbers(self):
         # Hide the numbers
-        for i in range(5):
-            for j in range(5):
+        for i in range(self._mode.length):
+            for j in range(MAX_DIGIT):
                 self._numbers[i][j].set_layer(HIDDEN_LAYER)
-                self._glownumbers[i][j].set_layer(HIDDEN_LAYER)
+                if self._deferred_done:
+                    self._glownumbers[i][j].set_layer(HIDDEN_LAYER)
         # Show user numbers
-        self._numbers[0][self._user_numbers[0] - 1].set_layer(NUMBER_LAYER)
-        self._numbers[1][self._user_numbers[1] - 1].set_layer(NUMBER_LAYER)
-        self._numbers[2][self._user_numbers[2] - 1].set_layer(NUMBER_LAYER)
-        self._numbers[3][self._user_numbers[3] - 1].set_layer(NUMBER_LAYER)
-        self._numbers[4][self._user_numbers[4] - 1].set_layer(NUMBER_LAYER)
+        for i, n in enumerate(self._user_numbers):
+            self._numbers[i][n - 1].set_layer(NUMBER_LAYER)
+        self._shown_numbers = list(self._user_numbers)
 
     def _show_background_graphics(self):
+        self._canvas_version += 1
         self._draw_pixbuf(
             self._parent.background_pixbuf(), 0, 0, self._width, self._height)
-        self._draw_pixbuf(
-            self._parent.box_pixbuf(self.ss(BS[self.i])),
-            self.sx(X1[self.i]), self.sy(Y1[self.i]), self.ss(BS[self.i]),
-            self.ss(BS[self.i]))
-        self._draw_pixbuf(
-            self._parent.box_pixbuf(self.ss(BS[self.i])),
-            self.sx(X2[self.i]), self.sy(Y2[self.i]), self.ss(BS[self.i]),
-            self.ss(BS[self.i]))
-        self._draw_text(self.pattern, self.sx(X1[self.i]),
-                        self.sy(Y1[self.i]), self.ss(LS[self.i]))
+        self._draw_boxes(self._cr, self.pattern)
+
+    def _draw_boxes(self, cr, pattern):
+        ''' The empty goal and user boxes, and the pattern number '''
+        size = self._layout.box_size
+        box = self._parent.box_pixbuf(size)
+        x, y = self._layout.target_box
+        self._draw_pixbuf(box, x, y, size, size, cr)
+        self._draw_text(pattern, x, y, self._layout.level_size, cr)
+        x, y = self._layout.user_box_xy
+        self._draw_pixbuf(box, x, y, size, size, cr)
 
     def _set_pen_size(self, ps):
         self._cr.set_line_width(ps)
 
-    def _set_color(self, color):
+    def _set_color(self, color, cr=None):
+        if cr is None:
+            cr = self._cr
         r = color[0] / 255.
         g = color[1] / 255.
         b = color[2] / 255.
-        self._cr.set_source_rgb(r, g, b)
+        cr.set_source_rgb(r, g, b)
+
+    def _set_canvas_scale(self, scale):
+        ''' Redo the turtle canvas with scale pixels per canvas unit
+
+        What has been drawn is carried over, resampled, along with
+        the pen.
+        '''
+        if scale == self._canvas_scale:
+            return
+        self._cancel_prefetch()
+        pixels = int(math.ceil(self._canvas_size * scale))
+        canvas = self._turtle_canvas.create_similar(
+            cairo.CONTENT_COLOR, pixels, pixels)
+        cr = cairo.Context(canvas)
+        cr.scale(scale / self._canvas_scale, scale / self._canvas_scale)
+        cr.set_source_surface(self._turtle_canvas, 0, 0)
+        cr.paint()
+        cr.identity_matrix()
+        cr.scale(scale, scale)
+        cr.set_line_cap(1)
+        cr.set_line_width(self._cr.get_line_width())
+        cr.set_source(self._cr.get_source())
+        self._turtle_canvas = canvas
+        self._cr = cr
+        self._canvas_scale = scale
+        self._sprites.set_cairo_context(cr)
+        self._canvas_version += 1
+
+    def _govern(self, ms):
+        ''' Let the quality governor judge a step that took ms '''
+        if not self._visible:
+            return  # catching up after a pause; not a fair measure
+        level = self.quality.step(ms, self.delay)
+        if level is None:
+            return
+        logging.debug('quality: %s' % self.quality.name())
+        self._set_canvas_scale(self.quality.resolution())
+        self.inval_all()
+
+    def _restore_quality(self):
+        ''' Back to a full resolution canvas once a run is over
+
+        The governor keeps its level as the start of the next run;
+        what this run drew is drawn again at full quality.
+        '''
+        if self._canvas_scale == 1:
+            return
+        self._set_canvas_scale(1.)
+        self._show_background_graphics()
+        self._draw_goal()
+        if isinstance(self._player, spirocore.SharedPlayer):
+            for program, (x, y, tile), color in self._compare:
+                self._draw_tile(x, y, tile, [128, 128, 128])
+            self._stroke_compare(enumerate(self._compare_steps))
+        elif self._timeline is not None:
+            self._set_pen_size(4)
+            self._set_color(self._colors[0])
+            self._timeline.trim()  # the checkpoints are low resolution
+            self._timeline.capture(self._cr, 0)
+            self._timeline.seek(self._timeline.position, self._cr,
+                                self._draw_step)
+        self.inval_all()
+
+    def _trace_antialias(self):
+        if self._player is not None and self._player.running and \
+                self.quality.level >= quality.NO_ANTIALIAS:
+            return cairo.ANTIALIAS_NONE
+        return cairo.ANTIALIAS_DEFAULT
 
     def _draw_line(self, x1, y1, x2, y2):
+        self._canvas_version += 1
         self._cr.move_to(x1, y1)
         self._cr.line_to(x2, y2)
         self._cr.stroke()
@@ -378,17 +643,21 @@ class Spirolaterals:
     def sy(self, f):  # scale y function
         return int(f * self.scale)
 
-    def _draw_pixbuf(self, pixbuf, x, y, w, h):
-        self._cr.save()
-        self._cr.translate(x + w / 2., y + h / 2.)
-        self._cr.translate(-x - w / 2., -y - h / 2.)
-        Gdk.cairo_set_source_pixbuf(self._cr, pixbuf, x, y)
-        self._cr.rectangle(x, y, w, h)
-        self._cr.fill()
-        self._cr.restore()
-
-    def _draw_text(self, label, x, y, size):
-        pl = PangoCairo.create_layout(self._cr)
+    def _draw_pixbuf(self, pixbuf, x, y, w, h, cr=None):
+        if cr is None:
+            cr = self._cr
+        cr.save()
+        cr.translate(x + w / 2., y + h / 2.)
+        cr.translate(-x - w / 2., -y - h / 2.)
+        Gdk.cairo_set_source_pixbuf(cr, pixbuf, x, y)
+        cr.rectangle(x, y, w, h)
+        cr.fill()
+        cr.restore()
+
+    def _draw_text(self, label, x, y, size, cr=None):
+        if cr is None:
+            cr = self._cr
+        pl = PangoCairo.create_layout(cr)
         fd = Pango.FontDescription('Sans')
         fd.set_size(int(size) * Pango.SCALE)
         pl.set_font_description(fd)
@@ -398,201 +667,791 @@ class Spirolaterals:
             pl.set_text(str(label), -1)
         else:
             pl.set_text(str(label), -1)
-        self._cr.save()
-        self._cr.translate(x, y)
-        self._cr.set_source_rgb(1, 1, 1)
-        PangoCairo.update_layout(self._cr, pl)
-        PangoCairo.show_layout(self._cr, pl)
-        self._cr.restore()
+        cr.save()
+        cr.translate(x, y)
+        cr.set_source_rgb(1, 1, 1)
+        PangoCairo.update_layout(cr, pl)
+        PangoCairo.show_layout(cr, pl)
+        cr.restore()
 
     def inval(self, r):
+        if not self._visible:
+            return
+        if tracing.enabled:
+            tracing.count('invalidations')
+            tracing.count('invalidated pixels', r[2] * r[3])
         self._canvas.queue_draw_area(r[0], r[1], r[2], r[3])
 
     def inval_all(self):
+        if not self._visible:
+            return
+        if tracing.enabled:
+            tracing.count('invalidations')
+            tracing.count('invalidated pixels', self._width * self._height)
         self._canvas.queue_draw_area(0, 0, self._width, self._height)
 
+    @tracing.traced('draw')
     def __draw_cb(self, canvas, cr):
-        cr.set_source_surface(self._turtle_canvas)
+        start = time.time()
+        if self._hud.visible:
+            self._hud.begin_frame(cr)
+        if self._canvas_scale == 1:
+            cr.set_source_surface(self._turtle_canvas)
+        else:
+            cr.save()
+            cr.scale(1. / self._canvas_scale, 1. / self._canvas_scale)
+            cr.set_source_surface(self._turtle_canvas)
+            cr.get_source().set_filter(cairo.FILTER_FAST)
+        cr.paint()
+        if self._canvas_scale != 1:
+            cr.restore()
+
+        drawn = self._sprites.redraw_sprites(cr=cr)
+        self._painted = True
+        if self._player is not None and self._player.running:
+            self.quality.frame((time.time() - start) * 1000.)
+        if self._hud.visible:
+            self._hud.end_frame(drawn)
+            self._hud.draw(cr, self._hud.lines(self.delay) +
+                           self._hud_lines())
+        if tracing.enabled:
+            tracing.frame()
+
+    def preview_png(self, width, height):
+        ''' PNG of the goal and user boxes at width x height
+
+        Cropped from the turtle canvas and scaled in one pass, so the
+        Journal preview costs no window capture. The result is kept
+        until something is drawn on the canvas again.
+        '''
+        key = (self._canvas_version, width, height)
+        if self._preview is not None and self._preview[0] == key:
+            return self._preview[1]
+        size = self._layout.box_size
+        (x1, y1), (x2, y2) = self._layout.target_box, self._layout.user_box_xy
+        left = min(x1, x2)
+        top = min(y1, y2)
+        w = max(x1, x2) + size - left
+        h = max(y1, y2) + size - top
+        # widen the crop to the preview's shape rather than letterbox
+        scale = min(width / float(w), height / float(h))
+        left -= (width / scale - w) / 2.
+        top -= (height / scale - h) / 2.
+        left = max(0, min(left, self._canvas_size - width / scale))
+        top = max(0, min(top, self._canvas_size - height / scale))
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+        cr = cairo.Context(surface)
+        cr.scale(scale, scale)
+        cr.translate(-left, -top)
+        cr.scale(1. / self._canvas_scale, 1. / self._canvas_scale)
+        cr.set_source_surface(self._turtle_canvas, 0, 0)
+        cr.get_source().set_filter(cairo.FILTER_FAST)
         cr.paint()
+        data = io.BytesIO()
+        surface.write_to_png(data)
+        self._preview = (key, data.getvalue())
+        return self._preview[1]
+
+    def _toggle_hud(self):
+        if self._hud.toggle():
+            self.memory()
+            self._start_hud_ticks()
+        self.inval(self._hud.rect)
+
+    def _start_hud_ticks(self):
+        if self._hud_source is None:
+            self._hud_source = self._scheduler.timeout_add(PerfHud.PERIOD,
+                                                           self._hud_tick)
+
+    def _hud_tick(self):
+        ''' Refresh only the overlay so it doesn't skew its own numbers '''
+        if self._hud.visible:
+            self.memory()  # here, not in every frame the overlay times
+            self.inval(self._hud.rect)
+            return True
+        self._hud_source = None
+        return False
+
+    def set_visible(self, visible):
+        ''' Stop drawing and timers while the activity can't be seen
+
+        A run is paused, not stopped. When the activity is seen again
+        it draws the steps it missed and the canvas is redrawn once.
+        Building hint rows and preparing the next level wait as well.
+        '''
+        if visible == self._visible:
+            return
+        if not visible:
+            self._visible = False
+            if self._player is not None:
+                self._player.pause()
+            self._clear_hint()
+            # idle work would keep making surfaces no one can see
+            for source in [self._hud_source, self._hints_source,
+                           self._prefetch_source]:
+                if source is not None:
+                    self._scheduler.source_remove(source)
+            self._hud_source = None
+            self._hints_source = None
+            self._prefetch_source = None  # the pieces wait
+            return
+        if self._player is not None:
+            self._player.resume()  # draws while invalidation is off
+        self._visible = True
+        if self._hud.visible:
+            self._start_hud_ticks()
+        self._start_hint_build()
+        self._resume_prefetch()
+        self.inval_all()
 
-        self._sprites.redraw_sprites(cr=cr)
+    def _hud_lines(self):
+        hits, misses, svg_bytes = self._parent.svg_cache_stats()
+        if hits + misses > 0:
+            rate = 100. * hits / (hits + misses)
+        else:
+            rate = 0.
+        return ['svg cache %d%% of %d   %.1f MB' % (
+                    rate, hits + misses, svg_bytes / 1048576.),
+                'surfaces %.1f MB   peak %.1f MB' % (
+                    self.memory_total / 1048576.,
+                    self.memory_peak / 1048576.),
+                'quality %s (%d changes)' % (self.quality.name(),
+                                            self.quality.changes)]
+
+    def surfaces(self):
+        ''' SurfaceUse of every surface and pixbuf the activity holds
+
+        Each is listed once, under the first of these that holds it:
+        the turtle canvas, the run's checkpoints, the game's card
+        images, the parent's caches and the sprites.
+        '''
+        pixels = int(math.ceil(self._canvas_size * self._canvas_scale))
+        uses = [surface_use(self._turtle_canvas, 'turtle canvas', pixels,
+                            pixels)]
+        if self._next_level is not None:
+            uses.append(surface_use(self._next_level[4], 'next level',
+                                    pixels, pixels))
+        if self._timeline is not None:
+            for surface, w, h in self._timeline.surfaces():
+                uses.append(surface_use(surface, 'timeline', w, h))
+        for size, images in self._card_images.items():
+            for base, mask in images:
+                uses.append(surface_use(base, 'card images %d' % size))
+                uses.append(surface_use(mask, 'card images %d' % size))
+        uses += self._parent.surfaces()
+        seen = set()
+        unique = []
+        for use in uses:
+            if id(use.surface) not in seen:
+                seen.add(id(use.surface))
+                unique.append(use)
+        return unique + self._sprites.surfaces(seen)
+
+    def memory(self):
+        ''' Pixel bytes held now; updates memory_total and memory_peak '''
+        total = sum([use.bytes for use in self.surfaces()])
+        self.memory_total = total
+        self.memory_peak = max(self.memory_peak, total)
+        return total
+
+    def check_memory(self):
+        ''' Trim caches, most easily rebuilt first, while over budget '''
+        if self.memory_budget is None:
+            return
+        total = self.memory()
+        if total <= self.memory_budget:
+            return
+        logging.warning('surfaces hold %d bytes, over the budget of %d' % (
+            total, self.memory_budget))
+        for trim in [self._cancel_prefetch, self._trim_card_images,
+                     self._trim_timeline, self._parent.trim_caches]:
+            trim()
+            total = self.memory()
+            if total <= self.memory_budget:
+                return
+        logging.warning('still %d bytes after trimming caches' % total)
+
+    def _trim_card_images(self):
+        ''' Keep only the card images at the current size '''
+        for size in list(self._card_images.keys()):
+            if size != self._card_size:
+                del self._card_images[size]
+
+    def _trim_timeline(self):
+        if self._timeline is not None:
+            self._timeline.trim()
 
     def do_stop(self):
+        self._record_attempt(history.STOPPED)
         self._parent.green.set_sensitive(True)
-        self._running = False
+        self._clear_hint()
+        if self._player is not None:
+            self._player.stop()
+        self._restore_quality()
 
     def do_run(self):
+        self._record_attempt(history.STOPPED)
+        self._flush_numbers()
+        self._ensure_deferred_sprites()
+        self._set_canvas_scale(self.quality.resolution())
         self._show_background_graphics()
         # TODO: Add turtle graphics
-        self._success.hide()
-        self._failure.hide()
-        self._splot.hide()
+        self._hide_results()
         self._get_goal()
         self._draw_goal()
         self.inval_all()
-        self._running = True
-        self.loop = 0
         self._active_index = 0
-        self.step = 0
         self._set_pen_size(4)
         self._set_color(self._colors[0])
-        x1 = self.sx(UX[self.i])
-        y1 = self.sy(UY[self.i])
-        dd = self.ss(US[self.i])
-        self._numbers[0][self._user_numbers[0] - 1].set_layer(HIDDEN_LAYER)
-        self._glownumbers[0][self._user_numbers[0] - 1].set_layer(NUMBER_LAYER)
-        self._user_turtles[0].move((int(x1 - dd / 2), y1))
-        self._show_turtle(0)
+        x1, y1, dd = self._user_start
+        self._reset_user_turtle()
+
+        if self._player is not None:
+            self._player.stop()
+        bounds = self._layout.user_box()
+        angle = self._mode.angle
+        run = spirocore.Run(self._user_numbers, x1, y1, dd, bounds=bounds,
+                            angle=angle)
+        self._timeline = Timeline(
+            spirocore.trace(self._user_numbers, x1, y1, dd, bounds=bounds,
+                            angle=angle),
+            (bounds[0] - dd - 4, bounds[1] - dd - 4,
+             bounds[2] - bounds[0] + 2 * dd + 8,
+             bounds[3] - bounds[1] + 2 * dd + 8), 4)
+        self._timeline.capture(self._cr, 0)
+        self.check_memory()
+        self._parent.set_scrub_range(len(self._timeline))
+        self._attempt = (list(self._user_numbers),
+                         int((time.time() - self._goal_shown) * 1000))
+        self._player = spirocore.Player(self, self._scheduler, run)
+        self._player.start()
+
+    def _compare_programs(self):
+        ''' The latest different programs tried on this pattern
+
+        Oldest first, with the cards as they are if there is room.
+        '''
+        programs = []
+        for attempt in reversed(self.history.attempts()):
+            if attempt.pattern == self.pattern and \
+                    attempt.angle == self._mode.angle and \
+                    len(attempt.program) == self._mode.length and \
+                    attempt.program not in programs:
+                programs.append(attempt.program)
+                if len(programs) == COMPARE:
+                    break
+        programs.reverse()
+        if len(programs) < COMPARE and self._user_numbers not in programs:
+            programs.append(list(self._user_numbers))
+        return programs
+
+    def do_compare(self, programs=None):
+        ''' Run programs side by side, each in a tile of the user box
+
+        By default these are the latest attempts at the pattern. All
+        of them are animated by one spirocore.SharedPlayer.
+        '''
+        self.do_stop()
+        self._flush_numbers()
+        self._ensure_deferred_sprites()
+        if programs is None:
+            programs = self._compare_programs()
+        self._hide_results()
+        self._clear_timeline()
+        self._set_canvas_scale(self.quality.resolution())
+        self._show_background_graphics()
+        self._get_goal()
+        self._draw_goal()
+        self._show_turtle(None)  # the tiles have no turtles
+        columns = int(math.ceil(math.sqrt(len(programs))))
+        size = self._layout.box_size
+        tile = size // columns
+        scale = tile / float(size)
+        bx, by = self._layout.user_box_xy
+        ux, uy, dd = self._user_start
+        self._compare = []
+        self._compare_steps = [[] for program in programs]
+        runs = []
+        for i, program in enumerate(programs):
+            x = bx + i % columns * tile
+            y = by + i // columns * tile
+            runs.append(spirocore.Run(
+                program, x + (ux - bx) * scale, y + (uy - by) * scale,
+                dd * scale, bounds=(x, y, x + tile, y + tile),
+                angle=self._mode.angle))
+            self._compare.append((list(program), (x, y, tile),
+                                  COMPARE_COLORS[i % len(COMPARE_COLORS)]))
+            self._draw_tile(x, y, tile, [128, 128, 128])
+        self._compare_pen = max(1, 4 * scale)
+        self._player = spirocore.SharedPlayer(self, self._scheduler, runs)
+        self._player.start()
+        self.inval_all()
 
-        if self._running:
-            GObject.timeout_add(self.delay, self._do_step, x1, y1, dd, 0)
+    def _draw_tile(self, x, y, tile, color):
+        self._cr.save()
+        self._set_color(color)
+        self._cr.set_line_width(1)
+        self._cr.rectangle(x + 0.5, y + 0.5, tile - 1, tile - 1)
+        self._cr.stroke()
+        self._cr.restore()
 
-    def _do_step(self, x1, y1, dd, h):
-        if not self._running:
-            return
-        if self.loop > 3:
+    def compare_steps(self, batch):
+        ''' SharedPlayer callback: one stroke per color for the batch '''
+        start = time.time()
+        for i, steps in batch:
+            self._compare_steps[i].extend(steps)
+        self._stroke_compare(batch)
+        self._canvas_version += 1
+        self._inval_user_box()
+        self._govern((time.time() - start) * 1000.)
+
+    def _stroke_compare(self, batch):
+        colors = OrderedDict()
+        for i, steps in batch:
+            colors.setdefault(tuple(self._compare[i][2]), []).extend(steps)
+        cr = self._cr
+        cr.save()
+        cr.set_antialias(self._trace_antialias())
+        cr.set_line_width(self._compare_pen)
+        for color, steps in colors.items():
+            self._set_color(color)
+            for step in steps:
+                if not step.out:  # it would cross into the next tile
+                    cr.move_to(step.x1, step.y1)
+                    cr.line_to(step.x2, step.y2)
+            cr.stroke()
+        cr.restore()
+
+    def compare_finish(self, last):
+        ''' SharedPlayer callback: frame each tile by its outcome '''
+        self._restore_quality()
+        for (program, (x, y, tile), color), step in zip(self._compare, last):
+            if spirocore.test_level(program, self._goal) and not step.out:
+                self._draw_tile(x, y, tile, MATCHED_COLOR)
+            else:
+                self._draw_tile(x, y, tile, EXTRA_COLOR)
+        self._canvas_version += 1
+        self._parent.green.set_sensitive(True)
+        self._inval_user_box()
+
+    def _inval_user_box(self):
+        x, y = self._layout.user_box_xy
+        size = self._layout.box_size
+        self.inval((x - 4, y - 4, size + 8, size + 8))
+
+    def _record_attempt(self, outcome):
+        ''' Add the run in progress, if any, to the history '''
+        if self._attempt is None:
             return
-        if h == 0:  # up
-            x2 = x1
-            y2 = y1 - dd
-            self._user_turtles[h].move((int(x2 - dd / 2), int(y2 - dd)))
-        elif h == 1:  # right
-            x2 = x1 + dd
-            y2 = y1
-            self._user_turtles[h].move((int(x2), int(y2 - dd / 2)))
-        elif h == 2:  # down
-            x2 = x1
-            y2 = y1 + dd
-            self._user_turtles[h].move((int(x2 - dd / 2), int(y2)))
-        elif h == 3:  # left
-            x2 = x1 - dd
-            y2 = y1
-            self._user_turtles[h].move((int(x2 - dd), int(y2 - dd / 2)))
-        self._show_turtle(h)
+        program, ms = self._attempt
+        self._attempt = None
+        self.history.add(self._mode.angle, self.pattern, program, outcome, ms)
 
-        if x2 < self.sx(X2[self.i]) or \
-           x2 > self.sx(X2[self.i] + BS[self.i]) or \
-           y2 < self.sy(Y2[self.i]) or \
-           y2 > self.sy(Y2[self.i] + BS[self.i]):
-            self.do_stop()
-            self._show_splot(x2, y2, dd, h)
+    def _clear_timeline(self):
+        self._timeline = None
+        self._parent.set_scrub_range(0)
 
-        self._draw_line(x1, y1, x2, y2)
+    def do_scrub(self, index):
+        ''' Show the user trace as it was after index segments '''
+        if self._timeline is None:
+            return
+        self.do_stop()
+        self._hide_results()
+        self._set_pen_size(4)
+        self._set_color(self._colors[0])
+        self._canvas_version += 1
+        self._timeline.seek(index, self._cr, self._draw_step)
+        index = self._timeline.position
+        if index > 0:
+            step = self._timeline.steps[index - 1]
+            self._move_turtle(step.x2, step.y2, self._user_start[2],
+                              step.heading)
+        else:
+            self._reset_user_turtle()
+        self._show_user_numbers()
+        self._parent.set_scrub_position(index)
         self.inval_all()
-        self.step += 1
-        i = self._active_index
-        if self.step == self._user_numbers[i]:
-            number = self._user_numbers[i] - 1
+
+    def _draw_step(self, step):
+        self._cr.set_antialias(self._trace_antialias())
+        self._draw_line(step.x1, step.y1, step.x2, step.y2)
+        self._cr.set_antialias(cairo.ANTIALIAS_DEFAULT)
+
+    def _glow_number(self, i, glow=True):
+        number = self._shown_numbers[i] - 1
+        if glow:
+            self._numbers[i][number].set_layer(HIDDEN_LAYER)
+            self._glownumbers[i][number].set_layer(NUMBER_LAYER)
+        else:
             self._numbers[i][number].set_layer(NUMBER_LAYER)
             self._glownumbers[i][number].set_layer(HIDDEN_LAYER)
-            h += 1
-            h %= 4
-            self.step = 0
-            self._active_index += 1
-            if self._active_index == 5:
-                self.loop += 1
-                self._active_index = 0
-            else:
-                i = self._active_index
-                number = self._user_numbers[i] - 1
-                self._numbers[i][number].set_layer(HIDDEN_LAYER)
-                self._glownumbers[i][number].set_layer(NUMBER_LAYER)
-
-        if self.loop < 4 and self._running:
-            GObject.timeout_add(self.delay, self._do_step, x2, y2, dd, h)
-        elif self.loop == 4:  # Test to see if we win
-            self._running = False
-            self._parent.green.set_sensitive(True)
-            self._reset_user_turtle()
-            self._show_user_numbers()
-            self._test_level()
+
+    def _follow_turtle(self, step):
+        ''' Move the turtle along, unless the last move isn't shown yet '''
+        if self.quality.level >= quality.SKIP_TURTLE and not self._painted:
+            return
+        self._painted = False
+        self._move_turtle(step.x2, step.y2, self._player.run.dd,
+                          step.heading)
+
+    def _move_turtle(self, x, y, dd, h):
+        ''' Put the turtle for heading h at the end of a segment '''
+        dx, dy = spirocore.turn_table(self._mode.angle)[h]
+        turtle = self._user_turtles[h]
+        # rotated images are larger than the upright one; keep centred
+        w, ht = turtle.get_dimensions()
+        w0, h0 = self._user_turtles[0].get_dimensions()
+        turtle.move((int(x + dx * dd / 2. - dd / 2. - (w - w0) / 2.),
+                     int(y + dy * dd / 2. - dd / 2. - (ht - h0) / 2.)))
+        self._show_turtle(h)
+
+    @tracing.traced('step')
+    def run_step(self, step):
+        ''' Player callback: draw one segment of the user program '''
+        start = time.time()
+        if self._hud.visible:
+            self._hud.step()
+        self._follow_turtle(step)
+        self._cr.set_antialias(self._trace_antialias())
+        self._draw_line(step.x1, step.y1, step.x2, step.y2)
+        self._cr.set_antialias(cairo.ANTIALIAS_DEFAULT)
+        self._timeline.advance(self._cr)
+        self._parent.set_scrub_position(self._timeline.position)
+        self.inval_all()
+        self._govern((time.time() - start) * 1000.)
+
+    @tracing.traced('steps')
+    def run_steps(self, steps):
+        ''' Player callback: draw a chunk of segments as one path '''
+        start = time.time()
+        cr = self._cr
+        cr.set_antialias(self._trace_antialias())
+        self._canvas_version += 1
+        for step in steps:
+            if self._hud.visible:
+                self._hud.step()
+            cr.move_to(step.x1, step.y1)
+            cr.line_to(step.x2, step.y2)
+            if self._timeline.checkpoint_due():
+                cr.stroke()  # the snapshot must include this segment
+            self._timeline.advance(cr)
+        cr.stroke()
+        cr.set_antialias(cairo.ANTIALIAS_DEFAULT)
+        self._follow_turtle(steps[-1])
+        self._parent.set_scrub_position(self._timeline.position)
+        self.inval_all()
+        self._govern((time.time() - start) * 1000.)
+
+    def run_glow(self, index, on):
+        ''' Player callback: highlight the number being drawn '''
+        self._glow_number(index, on)
+        if on:
+            self._active_index = index
+
+    def run_splot(self, step):
+        ''' Player callback: the turtle left the box '''
+        self._record_attempt(history.SPLOT)
+        self.do_stop()
+        self._show_splot(step.x2, step.y2, self._player.run.dd, step.heading)
+        self._draw_diff()
+
+    def run_finish(self):
+        ''' Player callback: test to see if we win '''
+        self._restore_quality()
+        self._active_index = 0
+        self._parent.green.set_sensitive(True)
+        self._reset_user_turtle()
+        self._show_user_numbers()
+        self._test_level()
+        self.check_memory()
 
     def _test_level(self):
-        success = True
-        for i in range(5):
-            if self._user_numbers[i] != self._goal[i]:
-                success = False
-                break
-        if success:
+        if spirocore.test_level(self._user_numbers, self._goal):
             self._do_success()
         else:
             self._do_fail()
 
     def _do_success(self):
+        first = self.pattern not in self._solved()
+        self._record_attempt(history.SOLVED)
         self._success.set_layer(SUCCESS_LAYER)
         self._parent.cyan.set_sensitive(True)
-        if self.last_pattern != self.pattern:
+        self._prefetch_next()
+        if first:  # each pattern scores once per mode
             self.score += 6
+        if self._mode.classic():
             self.last_pattern = self.pattern
         self._parent.update_score(int(self.score))
 
     def _do_fail(self):
+        self._record_attempt(history.FAILED)
         self._failure.set_layer(SUCCESS_LAYER)
         self._parent.cyan.set_sensitive(False)
+        self._draw_diff()
+
+    def _draw_diff(self):
+        ''' Mark matched, missing and extra segments in the user box '''
+        matched, missing, extra = spirocore.diff_segments(
+            self._goal, self._user_numbers, angle=self._mode.angle)
+        x, y, dd = self._user_start
+        left, top, right, bottom = self._layout.user_box()
+        self._canvas_version += 1
+        self._cr.save()
+        self._cr.rectangle(left, top, right - left, bottom - top)
+        self._cr.clip()
+        for edges, color, dash in ((matched, MATCHED_COLOR, []),
+                                   (extra, EXTRA_COLOR, []),
+                                   (missing, MISSING_COLOR, [dd / 5.])):
+            if not edges:
+                continue
+            self._set_color(color)
+            self._cr.set_dash(dash)
+            for (x1, y1), (x2, y2) in edges:
+                self._cr.move_to(x + x1 * dd, y + y1 * dd)
+                self._cr.line_to(x + x2 * dd, y + y2 * dd)
+            self._cr.stroke()
+        self._cr.restore()
+        self.inval((left, top, right - left, bottom - top))
 
     def do_slider(self, value):
         self.delay = int(value)
 
-    def do_button(self, bu):
-        self._success.hide()
-        self._failure.hide()
-        if bu == 'cyan':  # Next level
-            self.do_stop()
-            self._splot.hide()
-            self.pattern += 1
-            if self.pattern == 123:
-                self.pattern = 1
+    def get_mode(self):
+        return self._mode
+
+    def set_mode(self, angle, length):
+        ''' Play with another turn angle and program length '''
+        if angle == self._mode.angle and length == self._mode.length:
+            return
+        self.do_stop()
+        self._clear_timeline()
+        self._cancel_prefetch()
+        self._mode = spirocore.Mode(angle, length)
+        self.pattern = 1
+        self._user_numbers = (self._user_numbers + [1] * length)[:length]
+        self._active_index = 0
+        for cards in self._numbers:
+            for card in cards:
+                card.hide()
+        self._numbers = self._create_number_sprites(
+            self._parent.card_color())
+        if self._deferred_done:
+            for cards in self._glownumbers:
+                for card in cards:
+                    card.hide()
+            self._glownumbers = self._create_glow_sprites()
+            for turtle in self._user_turtles[1:]:
+                turtle.hide()
+            del self._user_turtles[1:]
+            self._create_turtle_headings()
+        self._parent.cyan.set_sensitive(False)
+        self.reset_level()
+        self.inval_all()
+
+    def set_pattern(self, pattern):
+        ''' Go to a pattern (the level browser or 'Next') '''
+        self._hide_results()
+        self.do_stop()
+        self._clear_timeline()
+        next_level = self._next_level
+        self._cancel_prefetch()
+        if next_level is not None and \
+                next_level[0] == self._level_key(pattern):
+            # already drawn in idle time: swap the canvases
+            key, self.pattern, goal, starts, canvas, cr = next_level
+            self._set_goal(goal, starts)
+            self._turtle_canvas = canvas
+            self._cr = cr
+            self._sprites.set_cairo_context(cr)
+            self._canvas_version += 1
+        else:
+            self.pattern = pattern
             self._get_goal()
             self._show_background_graphics()
             self._draw_goal()
-            self._reset_user_turtle()
-            self.inval_all()
-            self._parent.cyan.set_sensitive(False)
+        self._reset_user_turtle()
+        self.inval_all()
+        self._parent.cyan.set_sensitive(False)
+
+    def _level_key(self, pattern):
+        ''' What a canvas prepared for pattern depends on '''
+        return (pattern, self._mode.angle, self._mode.length,
+                self._width, self._height, self._canvas_scale)
+
+    def _prefetch_next(self):
+        ''' Draw the next pattern's canvas, a piece per idle callback '''
+        self._cancel_prefetch()
+        self._prefetch_pieces = self._prepare_level(
+            self._mode.next_pattern(self.pattern))
+        self._resume_prefetch()
+
+    def _resume_prefetch(self):
+        if self._prefetch_pieces is not None and \
+                self._prefetch_source is None and self._visible:
+            self._prefetch_source = self._scheduler.idle_add(
+                self._prefetch_piece)
+
+    def _prefetch_piece(self):
+        try:
+            next(self._prefetch_pieces)
+        except StopIteration:
+            self._prefetch_source = None
+            self._prefetch_pieces = None
+            return False
+        return True
+
+    def _cancel_prefetch(self):
+        if self._prefetch_source is not None:
+            self._scheduler.source_remove(self._prefetch_source)
+            self._prefetch_source = None
+        self._prefetch_pieces = None
+        self._next_level = None
+
+    def _prepare_level(self, pattern):
+        ''' Generator: the canvas set_pattern(pattern) would draw
+
+        Each step is about as much work as one piece of drawing, so no
+        idle callback holds up a frame for long.
+        '''
+        key = self._level_key(pattern)
+        pattern, goal = self._mode.get_goal(pattern)
+        starts = self._mode.starts(self._layout, goal)
+        yield
+        pixels = int(math.ceil(self._canvas_size * self._canvas_scale))
+        canvas = self._turtle_canvas.create_similar(
+            cairo.CONTENT_COLOR, pixels, pixels)
+        cr = cairo.Context(canvas)
+        cr.scale(self._canvas_scale, self._canvas_scale)
+        cr.set_line_cap(1)
+        yield
+        self._draw_pixbuf(self._parent.background_pixbuf(), 0, 0,
+                          self._width, self._height, cr)
+        yield
+        self._draw_boxes(cr, pattern)
+        yield
+        self._paint_goal(cr, goal, starts[0])
+        self._next_level = (key, pattern, goal, starts, canvas, cr)
+
+    def do_button(self, bu):
+        self._hide_results()
+        if bu == 'cyan':  # Next level
+            self.set_pattern(self._mode.next_pattern(self.pattern))
         elif bu == 'green':  # Run level
             self._parent.green.set_sensitive(False)
             self.do_run()
         elif bu == 'red':  # Stop level
             self.do_stop()
+        elif bu == 'hint':
+            self.do_hint()
+        elif bu == 'compare':
+            self.do_compare()
 
+    @tracing.traced('draw goal')
     def _draw_goal(self):  # draws the left hand pattern
-        x1 = self.sx(TX[self.i])
-        y1 = self.sy(TY[self.i])
-        dd = self.ss(TS[self.i])
-        dx = 0
-        dy = -dd
-        for i in range(4):
-            for j in self._goal:
-                for k in range(j):
-                    x2 = x1 + dx
-                    y2 = y1 + dy
-                    self._set_pen_size(4)
-                    self._set_color(self._colors[0])
-                    self._draw_line(x1, y1, x2, y2)
-                    x1 = x2
-                    y1 = y2
-                if dy == -dd:
-                    dx = dd
-                    dy = 0
-                elif dx == dd:
-                    dx = 0
-                    dy = dd
-                elif dy == dd:
-                    dx = -dd
-                    dy = 0
-                else:
-                    dx = 0
-                    dy = -dd
-
+        self._canvas_version += 1
+        self._paint_goal(self._cr, self._goal, self._target_start)
+
+    def _paint_goal(self, cr, goal, start):
+        ''' Stroke goal from start; leaves cr with the goal's pen '''
+        cr.set_line_width(4)
+        self._set_color(self._colors[0], cr)
+        x, y, dd = start
+        for x1, y1, x2, y2, h in spirocore.segments(
+                goal, x, y, dd, angle=self._mode.angle):
+            cr.move_to(x1, y1)
+            cr.line_to(x2, y2)
+            cr.stroke()
+
+    @tracing.traced('get goal')
     def _get_goal(self):
-        fname = os.path.join('data', 'patterns.dat')
-        try:
-            f = open(fname, 'r')
-            for n in range(0, self.pattern):
-                s = f.readline()
-            s = s[0:5]
-        except:
-            s = 11132
-            self.pattern = 1
-        f.close
-        l = [int(c) for c in str(s)]
-        self._goal = l
+        self.pattern, goal = self._mode.get_goal(self.pattern)
+        self._set_goal(goal, self._mode.starts(self._layout, goal))
+
+    def _set_goal(self, goal, starts):
+        ''' Make goal, with (target, user) starts, the current one '''
+        old = getattr(self, '_goal', None)
+        self._goal = goal
+        self._target_start, self._user_start = starts
+        if self._goal != old:
+            self._goal_shown = time.time()
+        if self._goal != old:
+            self._start_hint_build()
+
+    def _start_hint_build(self):
+        if self._hints_source is None and self._visible and \
+                self._mode.classic() and self._hints.row(self._goal) is None:
+            self._hints_source = self._scheduler.idle_add(self._build_hints)
+
+    def _build_hints(self):
+        ''' Idle callback: score another chunk of programs for the goal '''
+        if self._mode.classic() and self._hints.build(self._goal):
+            return True
+        self._hints_source = None
+        return False
+
+    def do_hint(self):
+        ''' Glow the card that brings the drawing closest to the goal '''
+        self.do_stop()
+        self._flush_numbers()
+        hint = self._hints.hint(self._user_numbers, self._goal,
+                                self._mode.angle)
+        if hint is None:
+            return
+        self._ensure_deferred_sprites()
+        i, digit = hint
+        self._active_index = i
+        self._numbers[i][self._user_numbers[i] - 1].set_layer(HIDDEN_LAYER)
+        self._glownumbers[i][digit - 1].set_layer(NUMBER_LAYER)
+        self._hint = (i, digit, self._scheduler.timeout_add(
+            HINT_MS, self._hint_timeout))
+        self.inval(self._glownumbers[i][digit - 1].rect)
+
+    def _hint_timeout(self):
+        self._hint = self._hint[:2] + (None,)
+        self._clear_hint()
+        return False
+
+    def _clear_hint(self):
+        ''' Put the user's own card back in place of the hint '''
+        if self._hint is None:
+            return
+        i, digit, source = self._hint
+        self._hint = None
+        if source is not None:
+            self._scheduler.source_remove(source)
+        self._glownumbers[i][digit - 1].set_layer(HIDDEN_LAYER)
+        self._numbers[i][self._shown_numbers[i] - 1].set_layer(NUMBER_LAYER)
+        self.inval(self._glownumbers[i][digit - 1].rect)
+
+
+def _blank_card(size):
+    ''' A number card without its digit '''
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, size, size)
+    cr = cairo.Context(surface)
+    r = 4  # as the card SVG
+    cr.arc(r, r, r, math.pi, 1.5 * math.pi)
+    cr.arc(size - r, r, r, 1.5 * math.pi, 2 * math.pi)
+    cr.arc(size - r, size - r, r, 0, 0.5 * math.pi)
+    cr.arc(r, size - r, r, 0.5 * math.pi, math.pi)
+    cr.close_path()
+    cr.set_source_rgb(0.5, 0.5, 0.5)
+    cr.fill()
+    return surface
+
+
+def _rotate(surface, degrees):
+    ''' The image turned clockwise about its centre '''
+    w = surface.get_width()
+    h = surface.get_height()
+    a = math.radians(degrees)
+    # a hair under the exact size so square turns don't gain a pixel
+    rw = int(math.ceil(abs(w * math.cos(a)) + abs(h * math.sin(a)) - 1e-6))
+    rh = int(math.ceil(abs(w * math.sin(a)) + abs(h * math.cos(a)) - 1e-6))
+    rotated = cairo.ImageSurface(surface.get_format(), rw, rh)
+    cr = cairo.Context(rotated)
+    cr.translate(rw / 2., rh / 2.)
+    cr.rotate(a)
+    cr.translate(-w / 2., -h / 2.)
+    cr.set_source_surface(surface, 0, 0)
+    cr.paint()
+    return rotated
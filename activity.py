@@ -16,19 +16,44 @@ version was based on the pygame library. This version uses Gtk and
 Cairo. """
 
 from gettext import gettext as _
+from collections import OrderedDict
+import binascii
 import logging
+import multiprocessing
+import os
+import Queue
+import sys
+import threading
+
+import cairo
 
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
+from gi.repository import GLib
 
 from sugar3.activity import activity
 from sugar3.graphics.toolbarbox import ToolbarBox
 from sugar3.activity.widgets import ActivityToolbarButton, StopButton
 from sugar3.graphics.toolbutton import ToolButton
+from sugar3.graphics import style
 from sugar3 import profile
 
 import Spirolaterals
+import spirocore
+from browser import LevelBrowser
+from sprites import surface_use
+import tracing
+
+MEMORY_ENV = 'SPIROLATERALS_MEMORY_MB'  # budget for Spirolaterals.memory()
+WORKERS_ENV = 'SPIROLATERALS_ASSET_WORKERS'  # threads for _AssetPool
+PREVIEW_SIZE = (style.zoom(300), style.zoom(225))  # as sugar3 uses
+SVG_CACHE_BYTES = 16 * 1024 * 1024  # pixel memory kept by the SVG cache
+MASKED_ICONS = 64  # (base, mask) pairs kept by the icon cache
+# cairo keeps an ARGB32 pixel as one native-endian 32-bit word, so in
+# memory it is B, G, R, A on little-endian machines and A, R, G, B on
+# big-endian ones; this is the offset of red within the four bytes
+RED_BYTE = 2 if sys.byteorder == 'little' else 1
 
 
 def _luminance(color):
@@ -55,7 +80,9 @@ class PeterActivity(activity.Activity):
     _UPPER = 1000
 
     def __init__(self, handle):
+        self._startup = tracing.PhaseTimer('startup')
         super(PeterActivity, self).__init__(handle)
+        self._startup.mark('sugar activity')
 
         # Get user's Sugar colors
         sugarcolors = profile.get_color().to_string().split(',')
@@ -85,6 +112,19 @@ class PeterActivity(activity.Activity):
             delay = int(self.metadata['delay'])
         else:
             delay = 500
+        angle = spirocore.ANGLE
+        if 'angle' in self.metadata and \
+                int(self.metadata['angle']) in spirocore.ANGLES:
+            angle = int(self.metadata['angle'])
+        length = spirocore.DIGITS
+        if 'length' in self.metadata:
+            length = min(max(int(self.metadata['length']),
+                             spirocore.MIN_DIGITS), spirocore.MAX_DIGITS)
+
+        self._startup.mark('metadata')
+
+        self._prefetch_assets(length)
+        self._startup.mark('asset jobs')
 
         # No sharing
         self.max_participants = 1
@@ -129,6 +169,28 @@ class PeterActivity(activity.Activity):
         self.cyan.set_sensitive(False)
         self.cyan.show()
 
+        hint = ToolButton('toolbar-help')
+        toolbox.toolbar.insert(hint, -1)
+        hint.set_tooltip(_('Hint'))
+        hint.connect('clicked', self._button_cb, 'hint')
+        hint.show()
+
+        compare = ToolButton('view-box')
+        toolbox.toolbar.insert(compare, -1)
+        compare.set_tooltip(_('Compare recent attempts'))
+        compare.connect('clicked', self._button_cb, 'compare')
+        compare.show()
+
+        browse = ToolButton('view-list')
+        toolbox.toolbar.insert(browse, -1)
+        browse.set_tooltip(_('Choose a pattern'))
+        browse.connect('clicked', self._browse_cb)
+        browse.show()
+        self._browser = None
+
+        self._add_scrub_slider(toolbox.toolbar)
+        self._add_mode_controls(toolbox.toolbar, angle, length)
+
         self._separator2 = Gtk.SeparatorToolItem()
         self._separator2.props.draw = False
         if Gdk.Screen.width() > 1023:
@@ -156,6 +218,7 @@ class PeterActivity(activity.Activity):
         self.set_toolbar_box(toolbox)
 
         self._toolbar = toolbox.toolbar
+        self._startup.mark('toolbar')
 
         # Create a canvas
         canvas = Gtk.DrawingArea()
@@ -163,16 +226,70 @@ class PeterActivity(activity.Activity):
                                 Gdk.Screen.height())
         self.set_canvas(canvas)
         canvas.show()
+        self._canvas = canvas
         self.show_all()
+        self._startup.mark('canvas')
 
         self._landscape = Gdk.Screen.width() > Gdk.Screen.height()
 
         self._game = Spirolaterals.Spirolaterals(
             canvas, colors, self, score=score, pattern=pattern, last=last,
-            delay=delay)
-
+            delay=delay, startup=self._startup,
+            mode=spirocore.Mode(angle, length))
+        if os.environ.get(MEMORY_ENV):
+            self._game.memory_budget = \
+                int(os.environ[MEMORY_ENV]) * 1024 * 1024
+            self._game.check_memory()
+
+        self._first_draw_id = canvas.connect_after('draw',
+                                                   self.__first_draw_cb)
+        _asset_pool.when_done(self.__assets_cb)
         Gdk.Screen.get_default().connect('size-changed', self.__configure_cb)
 
+        # Sugar hides an activity by covering it (another activity or
+        # the home view) and tells it when it stops being the active one
+        self._obscured = False
+        self.add_events(Gdk.EventMask.VISIBILITY_NOTIFY_MASK)
+        self.connect('visibility-notify-event', self.__visibility_notify_cb)
+        self.connect('notify::active', self.__active_cb)
+
+    def _prefetch_assets(self, length):
+        ''' Start rasterizing what the first screens show
+
+        The asset workers get on with it while the toolbar and canvas
+        are built; the game picks the results up as they arrive.
+        '''
+        width = Gdk.Screen.width()
+        height = Gdk.Screen.height() - style.GRID_CELL_SIZE
+        layout = spirocore.Layout(width, height, style.GRID_CELL_SIZE)
+        size = max(Gdk.Screen.width(), Gdk.Screen.height())
+        _prefetch_svg(_rect(size, size, 0, self.sugarcolors[1]))
+        _prefetch_svg(_rect(layout.box_size, layout.box_size, 10, '#000000'))
+        for number in range(1, spirocore.MAX_DIGIT + 1):
+            _prefetch_icon(_number, layout.card_size(length), 4, number)
+        for icon in [_turtle_icon, _splot_icon, _good_job_icon,
+                     _try_again_icon]:
+            _prefetch_icon(icon)
+
+    def __first_draw_cb(self, canvas, cr):
+        ''' Close the startup breakdown once the first frame is up '''
+        canvas.disconnect(self._first_draw_id)
+        self._startup.mark('first frame')
+        self._startup.report()
+
+    def __assets_cb(self):
+        ''' Every asset job has been delivered: the cards are all there '''
+        self._startup.mark('assets')
+        self._startup.report()
+
+    def __visibility_notify_cb(self, window, event):
+        self._obscured = \
+            event.state == Gdk.VisibilityState.FULLY_OBSCURED
+        self._game.set_visible(not self._obscured and self.get_active())
+
+    def __active_cb(self, widget, pspec):
+        self._game.set_visible(not self._obscured and self.get_active())
+
     def __configure_cb(self, event):
         ''' Screen size/orientation has changed '''
 
@@ -195,17 +312,58 @@ class PeterActivity(activity.Activity):
         self._game.reset_level()
 
     def read_file(self, path):
-        pass
+        ''' Attempt history from the Journal; decoded only when needed '''
+        try:
+            with open(path, 'rb') as f:
+                self._game.history.load(f.read())
+        except IOError as e:
+            logging.error('could not read history %s: %s' % (path, e))
+            return
+        self._game.history_loaded()
+
+    def get_preview(self):
+        ''' Journal preview drawn from the game canvas, not the window '''
+        return self._game.preview_png(*PREVIEW_SIZE)
 
     def write_file(self, path):
         self.metadata['score'] = str(self._game.score)
         self.metadata['level'] = str(self._game.pattern)
         self.metadata['last'] = str(self._game.last_pattern)
         self.metadata['delay'] = str(self._game.delay)
+        self.metadata['angle'] = str(self._game.get_mode().angle)
+        self.metadata['length'] = str(self._game.get_mode().length)
+        with open(path, 'wb') as f:
+            f.write(self._game.history.to_bytes())
 
     def _button_cb(self, button=None, color=None):
         self._game.do_button(color)
 
+    def _browse_cb(self, button=None):
+        ''' Swap the game for the level browser, or back '''
+        if self.get_canvas() is not self._canvas:
+            self._show_game()
+            return
+        self._game.do_stop()
+        if self._browser is None:
+            color = self.sugarcolors[0]
+            rgb = [int(color[i:i + 2], 16) / 255. for i in (1, 3, 5)]
+            self._browser = LevelBrowser(self._game.get_mode(),
+                                         self._game.pattern, rgb,
+                                         self._pick_cb)
+        else:
+            self._browser.set_mode(self._game.get_mode(), self._game.pattern)
+        self.set_canvas(self._browser.widget)
+        self._browser.widget.show()
+        GLib.idle_add(self._browser.scroll_to_current)
+
+    def _pick_cb(self, pattern):
+        self._game.set_pattern(pattern)
+        self._show_game()
+
+    def _show_game(self):
+        self.set_canvas(self._canvas)
+        self._canvas.grab_focus()
+
     def _add_speed_slider(self, toolbar, delay):
         self._speed_stepper_down = ToolButton('speed-down')
         self._speed_stepper_down.set_tooltip(_('Slow down'))
@@ -236,6 +394,77 @@ class PeterActivity(activity.Activity):
         toolbar.insert(self._speed_stepper_up, -1)
         return
 
+    def _add_scrub_slider(self, toolbar):
+        self._scrubbing = False
+        self._scrub_adjustment = Gtk.Adjustment.new(0, 0, 0, 1, 8, 0)
+        self._scrub_adjustment.connect('value_changed', self._scrub_cb)
+        self._scrub_range = Gtk.HScale.new(self._scrub_adjustment)
+        self._scrub_range.set_draw_value(False)
+        self._scrub_range.set_digits(0)
+        self._scrub_range.set_size_request(120, 15)
+        self._scrub_range.set_tooltip_text(_('Step through the drawing'))
+        self._scrub_range.set_sensitive(False)
+        self._scrub_range.show()
+
+        scrub_tool = Gtk.ToolItem()
+        scrub_tool.add(self._scrub_range)
+        scrub_tool.show()
+        toolbar.insert(scrub_tool, -1)
+
+    def _add_mode_controls(self, toolbar, angle, length):
+        self._angle_combo = Gtk.ComboBoxText()
+        for a in spirocore.ANGLES:
+            self._angle_combo.append_text(u'%d\u00b0' % a)
+        self._angle_combo.set_active(spirocore.ANGLES.index(angle))
+        self._angle_combo.set_tooltip_text(_('Turn angle'))
+        self._angle_combo.connect('changed', self._mode_cb)
+        self._angle_combo.show()
+
+        angle_tool = Gtk.ToolItem()
+        angle_tool.add(self._angle_combo)
+        angle_tool.show()
+        toolbar.insert(angle_tool, -1)
+
+        self._length_adjustment = Gtk.Adjustment.new(
+            length, spirocore.MIN_DIGITS, spirocore.MAX_DIGITS, 1, 1, 0)
+        self._length_adjustment.connect('value_changed', self._mode_cb)
+        self._length_spin = Gtk.SpinButton.new(self._length_adjustment, 1, 0)
+        self._length_spin.set_tooltip_text(_('Numbers in the program'))
+        self._length_spin.show()
+
+        length_tool = Gtk.ToolItem()
+        length_tool.add(self._length_spin)
+        length_tool.show()
+        toolbar.insert(length_tool, -1)
+
+    def _mode_cb(self, widget=None):
+        self._game.set_mode(
+            spirocore.ANGLES[self._angle_combo.get_active()],
+            int(self._length_adjustment.get_value()))
+        if self._browser is not None and \
+                self.get_canvas() is self._browser.widget:
+            self._browser.set_mode(self._game.get_mode(), self._game.pattern)
+            GLib.idle_add(self._browser.scroll_to_current)
+        return True
+
+    def _scrub_cb(self, adjustment=None):
+        if not self._scrubbing:
+            self._game.do_scrub(int(round(self._scrub_adjustment.get_value())))
+        return True
+
+    def set_scrub_range(self, steps):
+        ''' The game has a new timeline of steps segments '''
+        self._scrubbing = True
+        self._scrub_adjustment.set_upper(steps)
+        self._scrub_adjustment.set_value(0)
+        self._scrubbing = False
+        self._scrub_range.set_sensitive(steps > 0)
+
+    def set_scrub_position(self, step):
+        self._scrubbing = True
+        self._scrub_adjustment.set_value(step)
+        self._scrubbing = False
+
     def _speed_stepper_down_cb(self, button=None):
         new_value = self._speed_range.get_value() + 25
         if new_value <= self._UPPER:
@@ -259,27 +488,56 @@ class PeterActivity(activity.Activity):
         self._score_image.set_from_pixbuf(pixbuf)
         self._score_image.show()
 
-    def good_job_pixbuf(self):
-        return _svg_str_to_pixbuf(_good_job_icon(self.sugarcolors[0]))
+    def good_job_images(self, callback=None):
+        return _icon_images(callback, _good_job_icon)
 
-    def try_again_pixbuf(self):
-        return _svg_str_to_pixbuf(_try_again_icon(self.sugarcolors[0]))
+    def try_again_images(self, callback=None):
+        return _icon_images(callback, _try_again_icon)
 
     def background_pixbuf(self):
         size = max(Gdk.Screen.width(), Gdk.Screen.height())
         return _svg_str_to_pixbuf(_rect(size, size, 0, self.sugarcolors[1]))
 
-    def turtle_pixbuf(self):
-        return _svg_str_to_pixbuf(_turtle_icon(self.sugarcolors[0]))
+    def turtle_images(self, callback=None):
+        return _icon_images(callback, _turtle_icon)
 
-    def splot_pixbuf(self):
-        return _svg_str_to_pixbuf(_splot_icon(self.sugarcolors[0]))
+    def splot_images(self, callback=None):
+        return _icon_images(callback, _splot_icon)
 
     def box_pixbuf(self, size):
         return _svg_str_to_pixbuf(_rect(size, size, 10, '#000000'))
 
-    def number_pixbuf(self, size, number, color):
-        return _svg_str_to_pixbuf(_number(size, 4, number, color))
+    def number_images(self, size, number, callback=None):
+        return _icon_images(callback, _number, size, 4, number)
+
+    def card_color(self):
+        ''' Digit color for the number cards '''
+        if is_low_contrast([self.sugarcolors[1], '#808080']):
+            return '#000000'
+        return self.sugarcolors[1]
+
+    def svg_cache_stats(self):
+        ''' (hits, misses, bytes) of the rasterized SVG cache '''
+        return (_svg_cache.hits, _svg_cache.misses, _svg_cache.size)
+
+    def surfaces(self):
+        ''' SurfaceUse of the rasterized SVGs, icons and thumbnails kept '''
+        uses = [surface_use(pixbuf, 'svg cache')
+                for pixbuf in _svg_cache.pixbufs()]
+        for key, images in _masked_icons.items():
+            for surface in images:
+                uses.append(surface_use(surface, 'icon %s' % key[0]))
+        if self._browser is not None:
+            uses += [surface_use(surface, 'level browser')
+                     for surface in self._browser.surfaces()]
+        return uses
+
+    def trim_caches(self):
+        ''' Let go of every cached rasterization; they are made again '''
+        _svg_cache.clear()
+        _masked_icons.clear()
+        if self._browser is not None:
+            self._browser.trim()
 
 
 def _turtle_icon(color):
@@ -547,8 +805,318 @@ def _try_again_icon(color):
         '</svg>'
 
 
+class _SvgCache:
+    ''' Pixbufs keyed by SVG string; least recently used go first '''
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._pixbufs = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, svg_string):
+        return svg_string in self._pixbufs
+
+    def get(self, svg_string):
+        if svg_string in self._pixbufs:
+            self.hits += 1
+        elif _asset_pool.wait(svg_string) is None:
+            self.add(svg_string, _load_svg(svg_string))
+        pixbuf = self._pixbufs.pop(svg_string)
+        self._pixbufs[svg_string] = pixbuf  # most recently used
+        return pixbuf
+
+    def pixbufs(self):
+        return list(self._pixbufs.values())
+
+    def clear(self):
+        self._pixbufs.clear()
+        self.size = 0
+
+    def add(self, svg_string, pixbuf):
+        ''' Keep a newly rasterized pixbuf '''
+        if pixbuf is None or svg_string in self._pixbufs:
+            return
+        self.misses += 1
+        self._pixbufs[svg_string] = pixbuf
+        self.size += _pixbuf_bytes(pixbuf)
+        while self.size > self._max_bytes and len(self._pixbufs) > 1:
+            svg, old = self._pixbufs.popitem(last=False)
+            self.size -= _pixbuf_bytes(old)
+
+
+def _pixbuf_bytes(pixbuf):
+    return pixbuf.get_rowstride() * pixbuf.get_height()
+
+
+_svg_cache = _SvgCache(SVG_CACHE_BYTES)
+
+
 def _svg_str_to_pixbuf(svg_string):
-    ''' Load pixbuf from SVG string '''
+    ''' Load pixbuf from SVG string; callers must not modify it '''
+    return _svg_cache.get(svg_string)
+
+
+def _prefetch_svg(svg_string):
+    ''' Have the asset workers rasterize an SVG for _svg_str_to_pixbuf '''
+    if svg_string not in _svg_cache and \
+            not _asset_pool.pending(svg_string):
+        _asset_pool.submit(svg_string, _load_svg, (svg_string,),
+                           lambda pixbuf: _svg_cache.add(svg_string, pixbuf))
+
+
+_masked_icons = OrderedDict()
+
+
+def _masked_icon(icon, *args):
+    ''' Rasterize a one-color icon once as (base, mask) surfaces
+
+    icon(*args, color) is rendered with the color black and with
+    white; where the two differ is where the color shows. The black
+    render is the base and the difference becomes an A8 mask, so a
+    sprite can show the icon in any color (see Sprite.set_mask).
+    '''
+    key = (icon.__name__,) + args
+    if key not in _masked_icons and _asset_pool.wait(key) is None:
+        _add_masked_icon(key, _rasterize_icon(icon, args))
+    images = _masked_icons.pop(key)
+    _masked_icons[key] = images  # most recently used
+    return images
+
+
+def _add_masked_icon(key, images):
+    if images is None or key in _masked_icons:
+        return
+    _masked_icons[key] = images
+    while len(_masked_icons) > MASKED_ICONS:
+        _masked_icons.popitem(last=False)
+
+
+def _rasterize_icon(icon, args):
+    black = _load_svg(icon(*(args + ('#000000',))))
+    white = _load_svg(icon(*(args + ('#FFFFFF',))))
+    base = _pixbuf_to_surface(black)
+    return (base, _color_mask(base, _pixbuf_to_surface(white)))
+
+
+def _prefetch_icon(icon, *args):
+    ''' Have the asset workers rasterize an icon for _masked_icon '''
+    key = (icon.__name__,) + args
+    if key not in _masked_icons and not _asset_pool.pending(key):
+        _asset_pool.submit(key, _rasterize_icon, (icon, args),
+                           lambda images: _add_masked_icon(key, images))
+
+
+def _icon_images(callback, icon, *args):
+    ''' _masked_icon(icon, *args), or hand it to callback when it is ready
+
+    Without a callback this waits for the icon. With one, callback
+    gets it right away if it is cached and otherwise from the main
+    loop once the asset workers have rasterized it.
+    '''
+    if callback is None:
+        return _masked_icon(icon, *args)
+    key = (icon.__name__,) + args
+    if key in _masked_icons:
+        callback(_masked_icon(icon, *args))
+        return
+    _prefetch_icon(icon, *args)
+    _asset_pool.submit(key, _rasterize_icon, (icon, args),
+                       lambda images: callback(_masked_icon(icon, *args)))
+
+
+class _Job:
+
+    def __init__(self, fn, args, callback):
+        self.fn = fn
+        self.args = args
+        self.callbacks = [callback]
+        self.claimed = False  # a thread has started on it
+        self.done = threading.Event()
+        self.result = None
+
+
+class _AssetPool:
+    ''' Runs rasterization jobs in idle time or on worker threads
+
+    By default each job runs in its own idle callback on the main
+    loop, one after another, so the first frame is not held up.
+    Threads only pay off if the jobs really overlap: librsvg and
+    cairo let go of the GIL while they draw, but the Python around
+    them holds it. To compare, set SPIROLATERALS_ASSET_WORKERS to a
+    number of threads (or 'cores') and read the 'assets' phase of the
+    startup report, which closes when the last job is delivered.
+
+    Each result goes back to the main loop through GLib.idle_add,
+    where the job's callbacks get it. Jobs are keyed so that asking
+    twice for the same thing waits on the one job. Only the main
+    thread submits, waits or delivers.
+    '''
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = os.environ.get(WORKERS_ENV, '0')
+        if workers == 'cores':
+            try:
+                workers = multiprocessing.cpu_count()
+            except NotImplementedError:
+                workers = 1
+        self._workers = int(workers)
+        self._queue = Queue.Queue()
+        self._jobs = {}  # key: _Job not yet delivered
+        self._lock = threading.Lock()
+        self._threads = []
+        self._done_callbacks = []  # called once no job is left
+
+    def _start(self):
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._work,
+                                      name='asset worker %d' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, fn, args, callback):
+        ''' Run fn(*args) on a worker, then callback(result) on the main loop
+
+        If key is already queued or running, callback joins that job.
+        The result is None if fn raised.
+        '''
+        if key in self._jobs:
+            self._jobs[key].callbacks.append(callback)
+            return
+        self._jobs[key] = _Job(fn, args, callback)
+        if self._workers == 0:
+            GLib.idle_add(self._idle_run, key)
+            return
+        if not self._threads:
+            self._start()
+        self._queue.put(key)
+
+    def when_done(self, callback):
+        ''' Call callback() on the main loop once no job is left '''
+        if self._jobs:
+            self._done_callbacks.append(callback)
+        else:
+            callback()
+
+    def pending(self, key):
+        return key in self._jobs
+
+    def wait(self, key):
+        ''' Deliver key's job now, running it here if no worker has begun
+
+        Returns its result, or None if there is no such job.
+        '''
+        job = self._jobs.get(key)
+        if job is None:
+            return None
+        if self._claim(job):
+            self._run(job)
+        job.done.wait()
+        return self._deliver(key)
+
+    def _claim(self, job):
+        with self._lock:
+            if job.claimed:
+                return False
+            job.claimed = True
+            return True
+
+    def _run(self, job):
+        try:
+            job.result = job.fn(*job.args)
+        except Exception as e:
+            logging.error('asset job failed: %s' % e)
+        job.done.set()
+
+    def _work(self):
+        while True:
+            key = self._queue.get()
+            job = self._jobs.get(key)
+            if job is not None and self._claim(job):
+                self._run(job)
+                GLib.idle_add(self._idle_deliver, key)
+
+    def _idle_run(self, key):
+        job = self._jobs.get(key)
+        if job is not None and self._claim(job):
+            self._run(job)
+            self._deliver(key)
+        return False
+
+    def _idle_deliver(self, key):
+        self._deliver(key)
+        return False
+
+    def _deliver(self, key):
+        job = self._jobs.pop(key, None)
+        if job is None:  # wait() got there first
+            return None
+        for callback in job.callbacks:
+            callback(job.result)
+        if not self._jobs:
+            callbacks = self._done_callbacks
+            self._done_callbacks = []
+            for callback in callbacks:
+                callback()
+        return job.result
+
+
+_asset_pool = _AssetPool()
+
+
+def _pixbuf_to_surface(pixbuf):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, pixbuf.get_width(),
+                                 pixbuf.get_height())
+    cr = cairo.Context(surface)
+    Gdk.cairo_set_source_pixbuf(cr, pixbuf, 0, 0)
+    cr.paint()
+    return surface
+
+
+def _color_mask(black, white):
+    ''' A8 surface of how much of each pixel shows the icon color
+
+    black and white are the two renders painted into ARGB32 surfaces,
+    whose pixels cairo stores premultiplied by alpha. Red is as good
+    as any channel (the color is black or white), so the mask is the
+    white red byte less the black red byte, pixel by pixel.
+    '''
+    w = black.get_width()
+    h = black.get_height()
+    black.flush()
+    white.flush()
+    # ARGB32 rows are exactly w * 4 bytes, so every fourth byte from
+    # RED_BYTE is the red of one pixel, row after row: w * h bytes
+    k = bytes(black.get_data())[RED_BYTE::4]
+    c = bytes(white.get_data())[RED_BYTE::4]
+    mask = _subtract_bytes(c, k)
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_A8, w)
+    data = bytearray(stride * h)  # A8 rows may be padded past w
+    for y in range(h):
+        data[y * stride:y * stride + w] = mask[y * w:y * w + w]
+    return cairo.ImageSurface.create_for_data(data, cairo.FORMAT_A8, w, h,
+                                              stride)
+
+
+def _subtract_bytes(a, b):
+    ''' a[i] - b[i] for every byte, where no a[i] is less than b[i]
+
+    Done as one subtraction of the two strings read as big-endian
+    numbers, which runs in C: with no byte of b above its byte of a
+    nothing is ever borrowed from the byte before, so each byte of the
+    difference is its own pixel's.
+    '''
+    if not a:
+        return b''
+    n = int(binascii.hexlify(a), 16) - int(binascii.hexlify(b), 16)
+    return binascii.unhexlify('%0*x' % (2 * len(a), n))
+
+
+@tracing.traced('svg')
+def _load_svg(svg_string):
     pl = GdkPixbuf.PixbufLoader.new_with_type('svg')
     pl.write(svg_string)
     pl.close()
@@ -0,0 +1,417 @@
+#!/usr/bin/python
+# bench.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Headless benchmarks for sprites.py and the Spirolaterals render
+    path. No Sugar session is needed: sprites are driven with a stub
+    widget and everything is drawn into a cairo ImageSurface.
+
+    Usage:
+        python benchmarks/bench.py [--counts 50,500,5000,50000]
+                                   [--output results.json]
+                                   [--compare baseline.json]
+                                   [--smoke]
+
+    Results are written as JSON so that runs from different commits
+    can be compared with --compare. --smoke runs every benchmark on
+    small inputs, only to check that they still work (see
+    tests/test_bench.py).
+
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import cairo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from gi.repository import GdkPixbuf
+
+from sprites import Sprites, Sprite
+from simulation import VirtualScheduler
+from hints import HintIndex
+import hints
+import spirocore
+import tracing
+
+WIDTH = 1200
+HEIGHT = 900
+SPRITE_SIZE = 55
+DEFAULT_COUNTS = [50, 500, 5000, 50000]
+CLIP = (300, 300, 150, 150)  # area used for clipped redraws
+THRESHOLD = 0.10  # slowdown reported as a regression by --compare
+SMOKE_COUNTS = [50]
+SMOKE_PATTERNS = 3
+
+
+class StubWidget:
+    ''' Stands in for the Gtk.DrawingArea; counts invalidations '''
+
+    def __init__(self):
+        self.invalidations = 0
+
+    def queue_draw_area(self, x, y, width, height):
+        self.invalidations += 1
+
+    def queue_draw(self):
+        self.invalidations += 1
+
+    def get_property(self, name):
+        return StubWindow()
+
+    def connect(self, signal, callback):
+        pass
+
+    def set_can_focus(self, focus):
+        pass
+
+    def grab_focus(self):
+        pass
+
+    def add_events(self, mask):
+        pass
+
+
+class StubWindow:
+    ''' The widget's Gdk.Window, only for its cairo context '''
+
+    def cairo_create(self):
+        return cairo.Context(_surface(WIDTH, HEIGHT))
+
+
+class StubButton:
+
+    def set_sensitive(self, sensitive):
+        pass
+
+
+class StubParent:
+    ''' Provides the toolbar hooks and pixbufs Spirolaterals expects '''
+
+    def __init__(self):
+        self.sugarcolors = ['#FF8080', '#00588C']
+        self.green = StubButton()
+        self.cyan = StubButton()
+
+    def update_score(self, score):
+        pass
+
+    def set_scrub_range(self, steps):
+        pass
+
+    def set_scrub_position(self, step):
+        pass
+
+    def good_job_images(self, callback=None):
+        return _handed(callback, _masked(900, 150))
+
+    def try_again_images(self, callback=None):
+        return _handed(callback, _masked(900, 150))
+
+    def background_pixbuf(self):
+        return _pixbuf(WIDTH, WIDTH)
+
+    def turtle_images(self, callback=None):
+        return _handed(callback, _masked(SPRITE_SIZE, SPRITE_SIZE))
+
+    def splot_images(self, callback=None):
+        return _handed(callback, _masked(SPRITE_SIZE, SPRITE_SIZE))
+
+    def box_pixbuf(self, size):
+        return _pixbuf(size, size)
+
+    def number_images(self, size, number, callback=None):
+        return _handed(callback, _masked(size, size))
+
+    def card_color(self):
+        return self.sugarcolors[1]
+
+    def surfaces(self):
+        return []
+
+    def trim_caches(self):
+        pass
+
+
+def _pixbuf(width, height):
+    pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8,
+                                  width, height)
+    pixbuf.fill(0x808080ff)
+    return pixbuf
+
+
+def _handed(callback, images):
+    ''' Images returned, or passed on at once as the activity does when
+    they are cached '''
+    if callback is None:
+        return images
+    callback(images)
+
+
+def _masked(width, height):
+    mask = cairo.ImageSurface(cairo.FORMAT_A8, width, height)
+    cr = cairo.Context(mask)
+    cr.arc(width / 2., height / 2., min(width, height) / 3., 0, 6.3)
+    cr.fill()
+    return _surface(width, height), mask
+
+
+def _surface(width, height):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(0.5, 0.5, 0.5)
+    cr.paint()
+    return surface
+
+
+def _make_sprites(n, seed=0):
+    ''' Build a collection of n sprites scattered over the canvas '''
+    random.seed(seed)
+    sprites = Sprites(StubWidget())
+    image = _surface(SPRITE_SIZE, SPRITE_SIZE)
+    for i in range(n):
+        spr = Sprite(sprites, random.randint(0, WIDTH - SPRITE_SIZE),
+                     random.randint(0, HEIGHT - SPRITE_SIZE), image)
+        spr.layer = random.randint(0, 100)
+    sprites.list.sort(key=lambda spr: spr.layer)
+    return sprites
+
+
+def _time(fn, ops):
+    ''' Call fn ops times; return elapsed seconds '''
+    start = time.time()
+    for i in range(ops):
+        fn(i)
+    return time.time() - start
+
+
+def _record(results, name, ops, seconds):
+    results[name] = {'ops': ops, 'seconds': seconds,
+                     'per_op_us': seconds * 1e6 / ops}
+    print('%-40s %8d ops %12.2f us/op' % (name, ops,
+                                          results[name]['per_op_us']))
+
+
+def bench_sprites(results, counts):
+    ''' set_layer, find_sprite and redraw_sprites at each sprite count '''
+    target = _surface(WIDTH, HEIGHT)
+    cr = cairo.Context(target)
+    for n in counts:
+        sprites = _make_sprites(n)
+        random.seed(n)
+        ops = max(10, min(1000, 500000 // n))
+        picks = [sprites.list[random.randint(0, n - 1)] for i in range(ops)]
+        layers = [random.randint(0, 100) for i in range(ops)]
+        _record(results, 'sprites.set_layer[n=%d]' % n, ops,
+                _time(lambda i: picks[i].set_layer(layers[i]), ops))
+
+        points = [(random.randint(0, WIDTH), random.randint(0, HEIGHT))
+                  for i in range(ops)]
+        _record(results, 'sprites.find_sprite[n=%d]' % n, ops,
+                _time(lambda i: sprites.find_sprite(points[i]), ops))
+
+        ops = max(1, min(100, 5000 // n))
+        _record(results, 'sprites.redraw_full[n=%d]' % n, ops,
+                _time(lambda i: sprites.redraw_sprites(cr=cr), ops))
+        _record(results, 'sprites.redraw_clipped[n=%d]' % n, ops,
+                _time(lambda i: sprites.redraw_sprites(area=CLIP, cr=cr),
+                      ops))
+
+
+def bench_sprite(results):
+    ''' set_image and draw_label on an individual sprite '''
+    sprites = Sprites(StubWidget())
+    target = _surface(WIDTH, HEIGHT)
+    cr = cairo.Context(target)
+    sprites.set_cairo_context(cr)
+    surface = _surface(SPRITE_SIZE, SPRITE_SIZE)
+    pixbuf = _pixbuf(SPRITE_SIZE, SPRITE_SIZE)
+    spr = Sprite(sprites, 100, 100, surface)
+
+    ops = 1000
+    _record(results, 'sprite.set_image[surface]', ops,
+            _time(lambda i: spr.set_image(surface), ops))
+    _record(results, 'sprite.set_image[pixbuf]', ops,
+            _time(lambda i: spr.set_image(pixbuf), ops))
+
+    spr.set_label('12345')
+    spr.set_label_attributes(24)
+    _record(results, 'sprite.draw_label', ops,
+            _time(lambda i: spr.draw_label(cr), ops))
+
+
+def bench_svg(results):
+    ''' Rasterization of the activity artwork '''
+    try:
+        import activity
+    except ImportError as e:
+        print('skipping svg benchmarks: %s' % e)
+        return
+    _record(results, '_masked_icon[number]', 1,
+            _time(lambda i: activity._masked_icon(activity._number, 75, 4, 3),
+                  1))
+    svgs = [('number', activity._number(75, 4, 3, '#00588C')),
+            ('turtle', activity._turtle_icon('#FF8080')),
+            ('good_job', activity._good_job_icon('#FF8080')),
+            ('box', activity._rect(400, 400, 10, '#000000')),
+            ('background', activity._rect(WIDTH, WIDTH, 0, '#00588C'))]
+    for name, svg in svgs:
+        ops = 50
+        _record(results, '_load_svg[%s]' % name, ops,
+                _time(lambda i: activity._load_svg(svg), ops))
+        _record(results, '_svg_str_to_pixbuf[%s]' % name, ops,
+                _time(lambda i: activity._svg_str_to_pixbuf(svg), ops))
+
+
+def bench_core(results):
+    ''' Goal loading and path generation, no drawing '''
+    patterns = spirocore.load_patterns()
+    ops = len(patterns)
+    _record(results, 'core.get_goal[all]', ops,
+            _time(lambda i: spirocore.get_goal(i + 1), ops))
+
+    def walk(i):
+        for segment in spirocore.segments(patterns[i], 0, 0, 50):
+            pass
+
+    _record(results, 'core.segments[all]', ops, _time(walk, ops))
+
+    goal = patterns[0]
+    _record(results, 'core.hint_row', 1,
+            _time(lambda i: hints.build_row(goal), 1))
+    index = HintIndex(path=os.devnull)
+    while index.build(goal):
+        pass
+    programs = [hints.index_program(k) for k in range(hints.PROGRAMS)]
+    ops = len(programs)
+    _record(results, 'core.hint', ops,
+            _time(lambda i: index.hint(programs[i], goal), ops))
+
+
+def _headless_game():
+    ''' A Spirolaterals game bound to an ImageSurface instead of Gtk '''
+    try:
+        import Spirolaterals
+    except ImportError as e:
+        print('skipping game benchmarks: %s' % e)
+        return None
+    game = Spirolaterals.Spirolaterals(
+        StubWidget(), [[255, 128, 128], [0, 88, 140]], StubParent(),
+        delay=0, scheduler=VirtualScheduler(),
+        startup=tracing.PhaseTimer('headless game'),
+        screen=(WIDTH, HEIGHT + Spirolaterals.style.GRID_CELL_SIZE))
+    game._scheduler.run()  # the deferred sprites
+    return game
+
+
+def bench_game(results, patterns):
+    ''' Goal and trace drawing for every catalog pattern '''
+    game = _headless_game()
+    if game is None:
+        return
+
+    def draw_goal(i):
+        game.pattern = i + 1
+        game._get_goal()
+        game._draw_goal()
+
+    _record(results, 'game.draw_goal[all]', patterns,
+            _time(draw_goal, patterns))
+
+    def draw_trace(i):
+        game.pattern = i + 1
+        game._get_goal()
+        game._user_numbers = game._goal[:]
+        game.do_run()
+        game._scheduler.run()
+
+    _record(results, 'game.draw_trace[all]', patterns,
+            _time(draw_trace, patterns))
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold=THRESHOLD):
+    ''' Print per-benchmark ratios; return the names that regressed '''
+    regressions = []
+    for name in sorted(new['results']):
+        if name not in old['results']:
+            continue
+        before = old['results'][name]['per_op_us']
+        after = new['results'][name]['per_op_us']
+        ratio = after / before if before > 0 else 0
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-40s %12.2f -> %12.2f us/op  x%.2f%s' % (
+            name, before, after, ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Headless Spirolaterals benchmarks')
+    parser.add_argument('--counts', default=','.join(
+        [str(n) for n in DEFAULT_COUNTS]),
+        help='comma-separated sprite counts (default: %(default)s)')
+    parser.add_argument('--output', default=None,
+                        help='write JSON results to this file')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of a previous run to compare with')
+    parser.add_argument('--smoke', action='store_true',
+                        help='only check that every benchmark still runs')
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.counts.split(',')]
+    patterns = len(spirocore.load_patterns())
+    if args.smoke:
+        counts = SMOKE_COUNTS
+        patterns = SMOKE_PATTERNS
+
+    results = {}
+    bench_sprites(results, counts)
+    bench_sprite(results)
+    bench_svg(results)
+    bench_core(results)
+    bench_game(results, patterns)
+
+    run = {'meta': {'commit': _git_commit(),
+                    'python': platform.python_version(),
+                    'cairo': cairo.version,
+                    'machine': platform.machine(),
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+           'results': results}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=1, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            if compare(json.load(f), run):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+# browser.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    A scrolling grid of pattern thumbnails for picking a level.
+
+    The grid is one DrawingArea as tall as every row put together,
+    but a draw only visits the cells inside its clip, so the cost of
+    opening or scrolling doesn't depend on the size of the catalog.
+    A cell without a thumbnail is drawn as a blank box and queued;
+    an idle callback renders the queue a few milliseconds at a time,
+    skipping cells that have been scrolled away. Thumbnails are kept
+    in a least recently used cache of THUMBNAILS entries.
+
+"""
+import time
+from collections import OrderedDict
+
+from gi.repository import Gdk
+from gi.repository import GObject
+from gi.repository import Gtk
+
+from figures import figure_surface
+
+THUMBNAIL = 120  # pixels
+GAP = 12
+CELL = THUMBNAIL + 2 * GAP
+THUMBNAILS = 128  # thumbnails kept
+BUDGET = 8  # ms of rendering per idle callback
+BACKGROUND = (0.2, 0.2, 0.2)
+
+
+class LevelBrowser:
+    ''' Pattern thumbnails of a mode; on_pick(pattern) when one is clicked '''
+
+    def __init__(self, mode, current, rgb, on_pick):
+        self._on_pick = on_pick
+        self._rgb = rgb
+        self._thumbnails = OrderedDict()  # (angle, length, pattern): surface
+        self._wanted = []  # patterns waiting for a thumbnail
+        self._source = None
+        self._columns = 1
+
+        self._area = Gtk.DrawingArea()
+        self._area.add_events(Gdk.EventMask.BUTTON_PRESS_MASK)
+        self._area.connect('draw', self.__draw_cb)
+        self._area.connect('button-press-event', self.__button_press_cb)
+        self._area.show()
+
+        self.widget = Gtk.ScrolledWindow()
+        self.widget.set_policy(Gtk.PolicyType.NEVER,
+                               Gtk.PolicyType.AUTOMATIC)
+        self.widget.add_with_viewport(self._area)
+        self.widget.connect('size-allocate', self.__allocate_cb)
+
+        self.set_mode(mode, current)
+
+    def set_mode(self, mode, current):
+        ''' Show the patterns of mode, with current marked '''
+        self._mode = mode
+        self._count = mode.count()
+        self._current = current
+        self._wanted = []
+        self._resize()
+        self._area.queue_draw()
+
+    def scroll_to_current(self):
+        row = (self._current - 1) // self._columns
+        adjustment = self.widget.get_vadjustment()
+        adjustment.set_value(min(
+            row * CELL, adjustment.get_upper() - adjustment.get_page_size()))
+
+    def _resize(self):
+        rows = (self._count + self._columns - 1) // self._columns
+        self._area.set_size_request(-1, rows * CELL)
+
+    def __allocate_cb(self, widget, allocation):
+        columns = max(1, allocation.width // CELL)
+        if columns != self._columns:
+            self._columns = columns
+            self._resize()
+
+    def _cells(self, top, bottom):
+        ''' Patterns whose cells fall between top and bottom '''
+        first = max(0, int(top) // CELL) * self._columns
+        last = min(self._count, (int(bottom) // CELL + 1) * self._columns)
+        return range(first + 1, last + 1)
+
+    def _cell_xy(self, pattern):
+        i = pattern - 1
+        return (i % self._columns * CELL + GAP, i // self._columns * CELL + GAP)
+
+    def _key(self, pattern):
+        return (self._mode.angle, self._mode.length, pattern)
+
+    def __draw_cb(self, area, cr):
+        x1, y1, x2, y2 = cr.clip_extents()
+        cr.set_source_rgb(*BACKGROUND)
+        cr.paint()
+        cr.select_font_face('Sans')
+        cr.set_font_size(GAP - 2)
+        for pattern in self._cells(y1, y2):
+            x, y = self._cell_xy(pattern)
+            if pattern == self._current:
+                cr.set_source_rgb(1, 1, 1)
+                cr.rectangle(x - 3, y - 3, THUMBNAIL + 6, THUMBNAIL + 6)
+                cr.fill()
+            thumbnail = self._thumbnails.pop(self._key(pattern), None)
+            if thumbnail is None:
+                cr.set_source_rgb(0, 0, 0)
+                cr.rectangle(x, y, THUMBNAIL, THUMBNAIL)
+                cr.fill()
+                if pattern not in self._wanted:
+                    self._wanted.append(pattern)
+            else:
+                self._thumbnails[self._key(pattern)] = thumbnail
+                cr.set_source_surface(thumbnail, x, y)
+                cr.paint()
+            cr.set_source_rgb(0.8, 0.8, 0.8)
+            cr.move_to(x, y + THUMBNAIL + GAP - 2)
+            cr.show_text('%d' % pattern)
+        if self._wanted and self._source is None:
+            self._source = GObject.idle_add(self._render_wanted)
+
+    def _visible(self):
+        adjustment = self.widget.get_vadjustment()
+        top = adjustment.get_value()
+        return self._cells(top, top + adjustment.get_page_size())
+
+    def _render_wanted(self):
+        ''' Idle callback: render queued thumbnails still in view '''
+        deadline = time.time() + BUDGET / 1000.
+        visible = self._visible()
+        while self._wanted and time.time() < deadline:
+            pattern = self._wanted.pop(0)
+            if pattern not in visible:
+                continue  # scrolled away; drawn again if it comes back
+            pattern, goal = self._mode.get_goal(pattern)
+            self._thumbnails[self._key(pattern)] = figure_surface(
+                goal, self._mode, THUMBNAIL, self._rgb, (0, 0, 0))
+            while len(self._thumbnails) > THUMBNAILS:
+                self._thumbnails.popitem(last=False)
+            x, y = self._cell_xy(pattern)
+            self._area.queue_draw_area(x, y, THUMBNAIL, THUMBNAIL)
+        if self._wanted:
+            return True
+        self._source = None
+        return False
+
+    def surfaces(self):
+        ''' The cached thumbnails, for memory accounting '''
+        return list(self._thumbnails.values())
+
+    def trim(self):
+        self._thumbnails.clear()
+        self._area.queue_draw()
+
+    def __button_press_cb(self, area, event):
+        x, y = map(int, event.get_coords())
+        column = x // CELL
+        pattern = y // CELL * self._columns + column + 1
+        if column < self._columns and pattern <= self._count:
+            self._current = pattern
+            self._on_pick(pattern)
+        return True
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# figures.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Goal figures drawn with cairo away from the game canvas.
+
+    draw_figure() places a goal in a box of any size the way the game
+    places it in the target box (see spirocore.Mode.box_start), so
+    worksheets and thumbnails match what the activity shows. Only
+    cairo is needed; there is no gi import.
+
+    TileCache keeps rendered figures as PNG files named after the goal
+    itself rather than its pattern number, so after the catalog
+    changes only the goals that changed are drawn again.
+
+"""
+import os
+
+import cairo
+
+import spirocore
+
+PEN = 4 / 500.  # the game's pen width over its box size at 1200x900
+
+
+def draw_figure(cr, goal, mode, x, y, size, rgb=(0, 0, 0)):
+    ''' Stroke the goal figure in the size x size box at (x, y) '''
+    fx, fy, fd = mode.box_start(goal)
+    cr.save()
+    cr.set_line_cap(cairo.LINE_CAP_ROUND)
+    cr.set_line_join(cairo.LINE_JOIN_ROUND)
+    cr.set_line_width(max(1, size * PEN))
+    cr.set_source_rgb(*rgb)
+    for x1, y1, x2, y2, h in spirocore.segments(
+            goal, x + fx * size, y + fy * size, fd * size,
+            angle=mode.angle):
+        cr.move_to(x1, y1)
+        cr.line_to(x2, y2)
+    cr.stroke()
+    cr.restore()
+
+
+def figure_surface(goal, mode, size, rgb=(0, 0, 0), background=(1, 1, 1)):
+    ''' A size x size ImageSurface of the goal figure '''
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, size, size)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(*background)
+    cr.paint()
+    draw_figure(cr, goal, mode, 0, 0, size, rgb)
+    return surface
+
+
+class TileCache:
+    ''' PNG figures on disk, keyed by goal, angle and size '''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, goal, angle, size):
+        return os.path.join(self.directory, '%d-%s-%d.png' % (
+            angle, ''.join([str(n) for n in goal]), size))
+
+    def missing(self, goals, angle, size):
+        ''' The goals with no tile yet, each once '''
+        missing = []
+        for goal in goals:
+            if goal not in missing and \
+                    not os.path.exists(self.path(goal, angle, size)):
+                missing.append(goal)
+        return missing
+
+    def render(self, goal, angle, size):
+        ''' Draw a tile and store it; safe to call from worker processes '''
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                pass  # another worker made it first
+        path = self.path(goal, angle, size)
+        surface = figure_surface(goal, spirocore.Mode(angle, len(goal)), size)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        surface.write_to_png(tmp)
+        os.rename(tmp, path)  # never leave half a tile
+        return path
+
+    def load(self, goal, angle, size):
+        return cairo.ImageSurface.create_from_png(self.path(goal, angle, size))
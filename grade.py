@@ -0,0 +1,256 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# grade.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Grade a class's saved Spirolaterals entries without Gtk.
+
+    Each file is a Journal entry's data file (see history.py); its
+    name, less any extension, is taken as the student. Every attempt
+    is graded again with the game's own rules: the goal comes from
+    spirocore.Mode.get_goal() and a program is correct if
+    spirocore.test_level() says so. It also gets a similarity score,
+    0 to 100, between the figure it draws and the goal's (see
+    hints.similarity).
+
+    Usage:
+        python grade.py [--jobs N] [--format csv|json]
+                        [--output PREFIX] FILE...
+
+    Per-student and per-pattern totals go to PREFIX-students.csv and
+    PREFIX-patterns.csv (or PREFIX.json), or to standard output. The
+    records per second are reported on standard error.
+
+    Attempts are streamed from the files in batches, and only BATCHES
+    batches per worker are in flight at once, so memory depends on the
+    number of students and patterns, not on the number of attempts.
+
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import history
+import spirocore
+from hints import similarity
+
+BATCH = 500  # attempts sent to a worker at a time
+BATCHES = 2  # batches queued per worker
+
+STUDENT_FIELDS = ['student', 'attempts', 'correct', 'patterns',
+                  'patterns_solved', 'mean_similarity', 'minutes']
+PATTERN_FIELDS = ['angle', 'length', 'pattern', 'attempts', 'correct',
+                  'students', 'students_solved', 'attempts_to_solve',
+                  'mean_similarity']
+
+_goals = {}  # (angle, length, pattern): (goal, its unit edges)
+
+
+def _goal(angle, length, pattern):
+    key = (angle, length, pattern)
+    if key not in _goals:
+        pattern, goal = spirocore.Mode(angle, length).get_goal(pattern)
+        _goals[key] = (goal, spirocore.unit_segments(goal, angle=angle))
+    return _goals[key]
+
+
+def grade_batch(batch):
+    ''' [(student, attempt)] -> [(student, attempt, correct, similarity)] '''
+    graded = []
+    for student, attempt in batch:
+        goal, edges = _goal(attempt.angle, len(attempt.program),
+                            attempt.pattern)
+        correct = spirocore.test_level(attempt.program, goal)
+        score = similarity(edges, spirocore.unit_segments(
+            attempt.program, angle=attempt.angle)) * 100 // 255
+        graded.append((student, attempt, correct, score))
+    return graded
+
+
+def student_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def batches(paths, size=BATCH):
+    ''' Batches of (student, attempt), read from the files in turn '''
+    batch = []
+    for path in paths:
+        student = student_name(path)
+        with open(path, 'rb') as f:
+            for attempt in history.read_attempts(f):
+                batch.append((student, attempt))
+                if len(batch) == size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+class Totals:
+    ''' Running per-student and per-pattern aggregates
+
+    Attempts must arrive in the order each student made them, so the
+    attempts up to a first correct one can be counted.
+    '''
+
+    def __init__(self):
+        self.records = 0
+        self._students = collections.OrderedDict()
+        self._patterns = collections.OrderedDict()
+        self._progress = {}  # (student, pattern key): attempts, or True
+        self._ms = {}  # (student, pattern key): longest time on it
+
+    def add(self, student, attempt, correct, score):
+        self.records += 1
+        key = (attempt.angle, len(attempt.program), attempt.pattern)
+        s = self._students.setdefault(student, {
+            'attempts': 0, 'correct': 0, 'similarity': 0,
+            'patterns': set(), 'solved': set()})
+        p = self._patterns.setdefault(key, {
+            'attempts': 0, 'correct': 0, 'similarity': 0,
+            'students': set(), 'solved': 0, 'to_solve': 0})
+        for totals in (s, p):
+            totals['attempts'] += 1
+            totals['similarity'] += score
+            if correct:
+                totals['correct'] += 1
+        s['patterns'].add(key)
+        p['students'].add(student)
+        progress = self._progress.get((student, key), 0)
+        if progress is not True:
+            if correct:
+                s['solved'].add(key)
+                p['solved'] += 1
+                p['to_solve'] += progress + 1
+                progress = True
+            else:
+                progress += 1
+            self._progress[(student, key)] = progress
+        # ms is the time on the pattern so far, so the latest is total
+        self._ms[(student, key)] = max(self._ms.get((student, key), 0),
+                                       attempt.ms)
+
+    def students(self):
+        rows = []
+        for student, s in self._students.items():
+            ms = sum([self._ms[(student, key)] for key in s['patterns']])
+            rows.append({
+                'student': student,
+                'attempts': s['attempts'],
+                'correct': s['correct'],
+                'patterns': len(s['patterns']),
+                'patterns_solved': len(s['solved']),
+                'mean_similarity': round(
+                    s['similarity'] / float(s['attempts']), 1),
+                'minutes': round(ms / 60000., 1)})
+        return rows
+
+    def patterns(self):
+        rows = []
+        for (angle, length, pattern), p in sorted(self._patterns.items()):
+            to_solve = None
+            if p['solved']:
+                to_solve = round(p['to_solve'] / float(p['solved']), 2)
+            rows.append({
+                'angle': angle,
+                'length': length,
+                'pattern': pattern,
+                'attempts': p['attempts'],
+                'correct': p['correct'],
+                'students': len(p['students']),
+                'students_solved': p['solved'],
+                'attempts_to_solve': to_solve,
+                'mean_similarity': round(
+                    p['similarity'] / float(p['attempts']), 1)})
+        return rows
+
+
+def grade(paths, jobs=None, totals=None):
+    ''' Grade every attempt in the files across a pool of jobs processes '''
+    if totals is None:
+        totals = Totals()
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs <= 1:
+        for batch in batches(paths):
+            for graded in grade_batch(batch):
+                totals.add(*graded)
+        return totals
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # keep results in submission order and only a few in flight
+        waiting = collections.deque()
+        for batch in batches(paths):
+            waiting.append(pool.apply_async(grade_batch, (batch,)))
+            while len(waiting) >= jobs * BATCHES:
+                for graded in waiting.popleft().get():
+                    totals.add(*graded)
+        while waiting:
+            for graded in waiting.popleft().get():
+                totals.add(*graded)
+    finally:
+        pool.terminate()
+    return totals
+
+
+def _write_csv(f, fields, rows):
+    writer = csv.DictWriter(f, fields)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Grade saved Spirolaterals attempts')
+    parser.add_argument('files', nargs='+', help='Journal data files')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--output', help='file name prefix for the results')
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    totals = grade(args.files, args.jobs)
+    seconds = time.time() - start
+    rate = totals.records / seconds if seconds > 0 else 0
+
+    students = totals.students()
+    patterns = totals.patterns()
+    if args.format == 'json':
+        results = {'students': students, 'patterns': patterns,
+                   'records': totals.records,
+                   'records_per_second': round(rate)}
+        if args.output:
+            with open(args.output + '.json', 'w') as f:
+                json.dump(results, f, indent=1)
+        else:
+            json.dump(results, sys.stdout, indent=1)
+            print()
+    elif args.output:
+        with open(args.output + '-students.csv', 'w') as f:
+            _write_csv(f, STUDENT_FIELDS, students)
+        with open(args.output + '-patterns.csv', 'w') as f:
+            _write_csv(f, PATTERN_FIELDS, patterns)
+    else:
+        _write_csv(sys.stdout, STUDENT_FIELDS, students)
+        print()
+        _write_csv(sys.stdout, PATTERN_FIELDS, patterns)
+    print('%d records in %.2f s (%d records/s)' % (
+        totals.records, seconds, rate), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# hints.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Nearest-solution hints.
+
+    The similarity of two programs is the Jaccard index of the unit
+    edges they draw (see spirocore.unit_segments), scaled to 0..255 so
+    it fits in a byte. For a goal, the similarity of every one of the
+    5 ** 5 = 3125 possible programs is kept in a 3125 byte row indexed
+    by program_index(), so a hint is at most five lookups: one per
+    digit that differs from the goal.
+
+    Rows come from INDEX if it exists and matches the catalog (run
+    'python hints.py' to write it) or are built a chunk at a time from
+    idle callbacks. Until a goal's row is ready the candidates are
+    scored directly, which is slower but still quick.
+
+    Nothing here imports gi, so the index can be built offline.
+
+"""
+import os
+import struct
+import sys
+import zlib
+from collections import OrderedDict
+
+import spirocore
+from spirocore import ANGLE, DIGITS, MAX_DIGIT
+
+INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     'data', 'hints.dat')
+MAGIC = 'SPH1'
+PROGRAMS = MAX_DIGIT ** DIGITS  # 3125 possible programs
+CHUNK = 125  # programs scored per idle callback
+MAX_ROWS = 8  # rows built at run time that are kept
+
+
+def program_index(program):
+    ''' Position of a program in a row: its digits less one, base 5 '''
+    k = 0
+    for n in program:
+        k = k * MAX_DIGIT + n - 1
+    return k
+
+
+def index_program(k):
+    ''' The program at position k of a row '''
+    program = []
+    for i in range(DIGITS):
+        program.insert(0, k % MAX_DIGIT + 1)
+        k //= MAX_DIGIT
+    return program
+
+
+def similarity(a, b):
+    ''' Jaccard index of two edge sets, 0..255 '''
+    union = len(a | b)
+    if union == 0:
+        return 255
+    return 255 * len(a & b) // union
+
+
+def build_row(goal):
+    ''' Similarity of every program to the goal '''
+    wanted = spirocore.unit_segments(goal)
+    return bytearray([similarity(wanted,
+                                 spirocore.unit_segments(index_program(k)))
+                      for k in range(PROGRAMS)])
+
+
+def _catalog_crc(catalog):
+    with open(catalog, 'rb') as f:
+        return zlib.crc32(f.read()) & 0xffffffff
+
+
+def write_index(path=INDEX, catalog=spirocore.PATTERNS):
+    ''' Precompute a row for every pattern in the catalog '''
+    patterns = spirocore.load_patterns(catalog)
+    data = bytearray()
+    for goal in patterns:
+        data += build_row(goal)
+    with open(path, 'wb') as f:
+        f.write(MAGIC.encode('ascii'))
+        f.write(struct.pack('<II', _catalog_crc(catalog), len(patterns)))
+        f.write(zlib.compress(bytes(data), 9))
+    return len(patterns)
+
+
+def read_index(path=INDEX, catalog=spirocore.PATTERNS):
+    ''' {goal: row} from an index file, or {} if it is missing or stale '''
+    try:
+        with open(path, 'rb') as f:
+            if f.read(4) != MAGIC.encode('ascii'):
+                return {}
+            crc, count = struct.unpack('<II', f.read(8))
+            data = zlib.decompress(f.read())
+        if crc != _catalog_crc(catalog):
+            return {}
+    except (IOError, OSError, struct.error, zlib.error):
+        return {}
+    patterns = spirocore.load_patterns(catalog)
+    if count != len(patterns) or len(data) != count * PROGRAMS:
+        return {}
+    rows = {}
+    for i, goal in enumerate(patterns):
+        rows[tuple(goal)] = bytearray(data[i * PROGRAMS:(i + 1) * PROGRAMS])
+    return rows
+
+
+class HintIndex:
+    ''' Similarity rows per goal, from the index file or built in chunks '''
+
+    def __init__(self, path=INDEX, catalog=spirocore.PATTERNS):
+        self._path = path
+        self._catalog = catalog
+        self._file_rows = None  # read on first use
+        self._rows = OrderedDict()  # rows built at run time, LRU
+        self._partial = None  # (goal, wanted edges, row so far)
+
+    def _from_file(self, goal):
+        if self._file_rows is None:
+            self._file_rows = read_index(self._path, self._catalog)
+        return self._file_rows.get(goal)
+
+    def row(self, goal):
+        ''' The finished row for a goal, or None '''
+        goal = tuple(goal)
+        row = self._from_file(goal)
+        if row is None and goal in self._rows:
+            row = self._rows.pop(goal)
+            self._rows[goal] = row  # most recently used
+        return row
+
+    def build(self, goal, count=CHUNK):
+        ''' Score the next count programs; True while more remain
+
+        Meant to be called from an idle callback until it returns
+        False. Starting on a different goal drops the partial row.
+        '''
+        goal = tuple(goal)
+        if self.row(goal) is not None:
+            return False
+        if self._partial is None or self._partial[0] != goal:
+            self._partial = (goal, spirocore.unit_segments(goal), bytearray())
+        goal, wanted, row = self._partial
+        for k in range(len(row), min(len(row) + count, PROGRAMS)):
+            row.append(similarity(
+                wanted, spirocore.unit_segments(index_program(k))))
+        if len(row) < PROGRAMS:
+            return True
+        self._partial = None
+        self._rows[goal] = row
+        while len(self._rows) > MAX_ROWS:
+            self._rows.popitem(last=False)
+        return False
+
+    def hint(self, program, goal, angle=ANGLE):
+        ''' (position, digit) of the best single-digit change, or None
+
+        Any digit may go in any position that doesn't hold its goal
+        digit yet; each change is scored by how much of the goal its
+        drawing shares, and the best that brings the drawing closer
+        wins. Ties go to a goal digit, then to the smaller change,
+        then to the leftmost position. When no change gets closer the
+        hint puts a goal digit in place. Either way the hints never
+        go back, so following them ends at the goal. None means the
+        program is already the goal. Rows only exist for classic
+        programs; other modes score the candidates directly.
+        '''
+        program = list(program)
+        goal = list(goal)
+        if spirocore.test_level(program, goal):
+            return None
+        row = None
+        if angle == ANGLE and len(goal) == DIGITS:
+            row = self.row(goal)
+        wanted = None
+        if row is None:
+            wanted = spirocore.unit_segments(goal, angle=angle)
+
+        def score(candidate):
+            if row is not None:
+                return row[program_index(candidate)]
+            return similarity(wanted, spirocore.unit_segments(
+                candidate, angle=angle))
+
+        now = score(program)
+        best = None
+        for i, n in enumerate(program):
+            if n == goal[i]:
+                continue
+            for d in range(1, MAX_DIGIT + 1):
+                if d == n:
+                    continue
+                closer = score(program[:i] + [d] + program[i + 1:])
+                if closer <= now and d != goal[i]:
+                    continue
+                key = (closer > now, closer, d == goal[i], -abs(d - n), -i)
+                if best is None or key > best[0]:
+                    best = (key, (i, d))
+        return best[1]
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        path = INDEX
+    print('%d patterns indexed in %s' % (write_index(path), path))
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# history.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Every program a student has run, for teachers to review.
+
+    The history is kept in the Journal file as MAGIC followed by a
+    stream of records made of unsigned LEB128 varints:
+
+        head     (seconds since the previous record << 2)
+                 | (mode follows << 1) | (time is absolute)
+        angle    turn angle, only if the mode follows
+        length   numbers in a program, only if the mode follows
+        pattern
+        program  its digits less one, as one base MAX_DIGIT number
+        result   (ms on the pattern before the run << 2) | outcome
+
+    The first record written in a session has an absolute time and
+    its mode, so each session decodes on its own. New attempts are
+    appended to the bytes read back from the Journal without decoding
+    them; they are only decoded when someone asks for the attempts.
+    A typical record takes eight bytes.
+
+    Nothing here imports gi, so histories can be read by scripts.
+
+"""
+import time
+from collections import namedtuple
+
+from spirocore import MAX_DIGIT
+
+MAGIC = b'SPA1'
+CHUNK = 64 * 1024  # bytes read at a time by read_attempts()
+FAILED, SOLVED, SPLOT, STOPPED = range(4)
+OUTCOMES = ['failed', 'solved', 'splot', 'stopped']
+
+Attempt = namedtuple('Attempt', 'time angle pattern program outcome ms')
+
+
+def put_varint(data, n):
+    ''' Append n >= 0 to a bytearray '''
+    while n > 0x7f:
+        data.append(n & 0x7f | 0x80)
+        n >>= 7
+    data.append(n)
+
+
+def get_varint(data, offset):
+    ''' (n, offset after it) of the varint at offset '''
+    n = 0
+    shift = 0
+    while True:
+        b = data[offset]
+        offset += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, offset
+        shift += 7
+
+
+def _record(data, offset, state):
+    ''' (attempt, offset after it) for the record at offset
+
+    state is [time, angle, length] carried from the previous record;
+    it is only updated once the whole record has been read, so a
+    record cut short raises IndexError and leaves it as it was.
+    '''
+    t, angle, length = state
+    head, offset = get_varint(data, offset)
+    if head & 1:
+        t = head >> 2
+    else:
+        t += head >> 2
+    if head & 2:
+        angle, offset = get_varint(data, offset)
+        length, offset = get_varint(data, offset)
+    if length is None:
+        raise ValueError('session without a mode')
+    pattern, offset = get_varint(data, offset)
+    k, offset = get_varint(data, offset)
+    result, offset = get_varint(data, offset)
+    program = []
+    for i in range(length):
+        program.insert(0, k % MAX_DIGIT + 1)
+        k //= MAX_DIGIT
+    state[:] = [t, angle, length]
+    return Attempt(t, angle, pattern, program, result & 3,
+                   result >> 2), offset
+
+
+def decode(data):
+    ''' The attempts in a record stream (without MAGIC)
+
+    A record cut short, as by a truncated file, ends the list.
+    '''
+    data = bytearray(data)
+    attempts = []
+    state = [0, None, None]
+    offset = 0
+    try:
+        while offset < len(data):
+            attempt, offset = _record(data, offset, state)
+            attempts.append(attempt)
+    except (IndexError, ValueError):
+        pass
+    return attempts
+
+
+def read_attempts(f, size=CHUNK):
+    ''' Yield the attempts in a file written by History.to_bytes()
+
+    The file is read size bytes at a time, so memory does not grow
+    with its length. Nothing is yielded if it doesn't start with MAGIC.
+    '''
+    if bytearray(f.read(len(MAGIC))) != bytearray(MAGIC):
+        return
+    data = bytearray()
+    state = [0, None, None]
+    offset = 0
+    more = True
+    while more:
+        piece = f.read(size)
+        more = len(piece) > 0
+        data = data[offset:] + bytearray(piece)
+        offset = 0
+        while offset < len(data):
+            try:
+                attempt, offset = _record(data, offset, state)
+            except IndexError:
+                break  # the rest of the record is in the next piece
+            except ValueError:
+                return
+            yield attempt
+
+
+class History:
+    ''' Attempts read back from the Journal plus those made since '''
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._old = bytearray()  # records from earlier sessions
+        self._decoded = None  # their attempts, once asked for
+        self._new = bytearray()  # records from this session
+        self._attempts = []  # and their attempts
+        self._last = None  # (time, angle, length) of the last new record
+
+    def load(self, data):
+        ''' Attempts from earlier sessions, as written by to_bytes()
+
+        Data that doesn't start with MAGIC is ignored. Nothing is
+        decoded until attempts() is called.
+        '''
+        data = bytearray(data)
+        if data[:len(MAGIC)] != bytearray(MAGIC):
+            return False
+        self._old = data[len(MAGIC):] + self._old
+        self._decoded = None
+        return True
+
+    def add(self, angle, pattern, program, outcome, ms):
+        ''' Record a run of program on pattern, ms after it was shown '''
+        t = int(self._clock())
+        if self._last is None or t < self._last[0]:
+            head = t << 2 | 1
+        else:
+            head = (t - self._last[0]) << 2
+        mode = (angle, len(program))
+        if self._last is None or self._last[1:] != mode:
+            head |= 2
+        put_varint(self._new, head)
+        if head & 2:
+            put_varint(self._new, angle)
+            put_varint(self._new, len(program))
+        put_varint(self._new, pattern)
+        k = 0
+        for n in program:
+            k = k * MAX_DIGIT + n - 1
+        put_varint(self._new, k)
+        put_varint(self._new, int(ms) << 2 | outcome)
+        self._last = (t,) + mode
+        self._attempts.append(Attempt(t, angle, pattern, list(program),
+                                      outcome, int(ms)))
+
+    def attempts(self):
+        ''' Every attempt, oldest first '''
+        if self._decoded is None:
+            self._decoded = decode(self._old)
+        return self._decoded + self._attempts
+
+    def solved(self, angle, length):
+        ''' The patterns solved so far with this angle and length '''
+        return set(attempt.pattern for attempt in self.attempts()
+                   if attempt.outcome == SOLVED and attempt.angle == angle
+                   and len(attempt.program) == length)
+
+    def to_bytes(self):
+        return bytes(bytearray(MAGIC) + self._old + self._new)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# hud.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    On-canvas performance overlay: frame time with a p95 and histogram,
+    actual versus requested step rate, sprites drawn and area repainted
+    per frame, plus whatever extra lines the game supplies.
+
+    Frames whose clip lies inside the overlay are repaints of the
+    overlay itself and are left out of the statistics.
+
+"""
+import time
+from collections import deque
+
+from gi.repository import Pango
+from gi.repository import PangoCairo
+
+FRAMES = 240  # frame times kept for the p95 and histogram
+STEPS = 32  # step timestamps kept for the step rate
+BINS = 16  # histogram bins
+BIN_MS = 2.  # width of a histogram bin
+
+
+class PerfHud:
+    ''' Frame and step statistics drawn over the canvas '''
+
+    WIDTH = 300
+    HEIGHT = 170
+    PERIOD = 500  # ms between overlay refreshes
+
+    def __init__(self, x=0, y=0):
+        self.visible = False
+        self.rect = [x, y, self.WIDTH, self.HEIGHT]
+        self._frames = deque(maxlen=FRAMES)
+        self._steps = deque(maxlen=STEPS)
+        self._frame_start = 0
+        self._overlay_only = False
+        self._area = 0
+        self.sprites_drawn = 0
+        self.area = 0
+
+    def move(self, x, y):
+        self.rect[0] = x
+        self.rect[1] = y
+
+    def toggle(self):
+        self.visible = not self.visible
+        if self.visible:
+            self._frames.clear()
+            self._steps.clear()
+        return self.visible
+
+    def begin_frame(self, cr):
+        ''' Start timing a frame; note its repainted area '''
+        x1, y1, x2, y2 = cr.clip_extents()
+        self._overlay_only = \
+            x1 >= self.rect[0] and x2 <= self.rect[0] + self.rect[2] and \
+            y1 >= self.rect[1] and y2 <= self.rect[1] + self.rect[3]
+        self._area = int((x2 - x1) * (y2 - y1))
+        self._frame_start = time.time()
+
+    def end_frame(self, sprites_drawn):
+        ''' Record the frame unless it only repainted the overlay '''
+        if self._overlay_only:
+            return
+        self._frames.append((time.time() - self._frame_start) * 1000.)
+        self.sprites_drawn = sprites_drawn
+        self.area = self._area
+
+    def step(self):
+        self._steps.append(time.time())
+
+    def frame_time(self):
+        if not self._frames:
+            return 0.
+        return self._frames[-1]
+
+    def p95(self):
+        if not self._frames:
+            return 0.
+        frames = sorted(self._frames)
+        return frames[int(0.95 * (len(frames) - 1))]
+
+    def histogram(self):
+        ''' Frame counts per BIN_MS bin; the last bin collects the rest '''
+        bins = [0] * BINS
+        for t in self._frames:
+            bins[min(int(t / BIN_MS), BINS - 1)] += 1
+        return bins
+
+    def step_rate(self):
+        ''' Steps per second over the recent steps of the current run '''
+        if len(self._steps) < 2:
+            return 0.
+        elapsed = self._steps[-1] - self._steps[0]
+        if elapsed <= 0 or time.time() - self._steps[-1] > 2.:
+            return 0.
+        return (len(self._steps) - 1) / elapsed
+
+    def lines(self, delay):
+        if delay > 0:
+            requested = '%.1f' % (1000. / delay)
+        else:
+            requested = 'max'
+        return ['frame %5.1f ms   p95 %5.1f ms' % (self.frame_time(),
+                                                   self.p95()),
+                'steps/s %5.1f of %s (delay %d ms)' % (self.step_rate(),
+                                                       requested, delay),
+                'sprites %d   area %d px' % (self.sprites_drawn,
+                                              self.area)]
+
+    def draw(self, cr, lines):
+        ''' Paint the overlay inside self.rect '''
+        x, y, w, h = self.rect
+        cr.save()
+        cr.rectangle(x, y, w, h)
+        cr.clip()
+        cr.set_source_rgba(0, 0, 0, 0.75)
+        cr.paint()
+
+        pl = PangoCairo.create_layout(cr)
+        fd = Pango.FontDescription('Monospace')
+        fd.set_size(8 * Pango.SCALE)
+        pl.set_font_description(fd)
+        pl.set_text('\n'.join(lines), -1)
+        cr.set_source_rgb(1, 1, 1)
+        cr.move_to(x + 6, y + 4)
+        PangoCairo.update_layout(cr, pl)
+        PangoCairo.show_layout(cr, pl)
+
+        bins = self.histogram()
+        peak = max(max(bins), 1)
+        bar = (w - 12) / float(BINS)
+        base = y + h - 6
+        for i, n in enumerate(bins):
+            if i * BIN_MS >= 1000. / 60:
+                cr.set_source_rgb(1, 0.4, 0.4)  # slower than 60 fps
+            else:
+                cr.set_source_rgb(0.4, 1, 0.4)
+            height = 40. * n / peak
+            cr.rectangle(x + 6 + i * bar, base - height, bar - 1, height)
+            cr.fill()
+        cr.restore()
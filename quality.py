@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# quality.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Trades drawing quality for speed on machines that can't keep up.
+
+    While a program runs, the game reports how long each step took to
+    draw and how long each frame took to paint. Every WINDOW steps the
+    governor compares their cost with what the requested delay allows:
+    the delay itself, or one FRAME_MS frame at full speed. Over budget
+    it steps down a level, each giving up something more:
+
+        FULL            everything as designed
+        NO_ANTIALIAS    trace strokes drawn without antialiasing
+        LOW_RES         the turtle canvas at RESOLUTION of its size,
+                        scaled up when painted
+        SKIP_TURTLE     the turtle only moves once a frame has shown
+                        its last position
+
+    With the cost under HEADROOM of the budget it steps back up. The
+    samples start over after every change, so each level is judged on
+    its own. Nothing here imports gi or cairo.
+
+"""
+FULL, NO_ANTIALIAS, LOW_RES, SKIP_TURTLE = range(4)
+LEVELS = ['full', 'no antialiasing', 'low resolution', 'skip turtle']
+WINDOW = 12  # steps between decisions
+FRAME_MS = 1000 / 60.  # budget per frame when there is no delay
+HEADROOM = 0.5  # step up when the cost is under this part of the budget
+RESOLUTION = 0.5  # turtle canvas scale at LOW_RES and below
+
+
+class QualityGovernor:
+    ''' Picks a quality level from the measured step and frame times '''
+
+    def __init__(self, level=FULL):
+        self.level = level
+        self.changes = 0  # level changes so far
+        self._steps = []
+        self._frames = []
+
+    def name(self):
+        return LEVELS[self.level]
+
+    def resolution(self):
+        ''' Scale of the turtle canvas at this level '''
+        if self.level >= LOW_RES:
+            return RESOLUTION
+        return 1.
+
+    def frame(self, ms):
+        ''' A frame of a run took ms to paint '''
+        self._frames.append(ms)
+
+    def step(self, ms, delay):
+        ''' A step (or chunk at full speed) took ms to draw
+
+        Returns the new level when it changes, otherwise None.
+        '''
+        self._steps.append(ms)
+        if len(self._steps) < WINDOW:
+            return None
+        frame = 0.
+        if self._frames:
+            frame = sum(self._frames) / len(self._frames)
+        if delay > 0:
+            # one frame follows each step
+            budget = delay
+            cost = sum(self._steps) / len(self._steps) + frame
+        else:
+            # steps fill their chunk by design; only frames can lag
+            budget = FRAME_MS
+            cost = frame
+        level = self.level
+        if cost > budget and level < SKIP_TURTLE:
+            level += 1
+        elif cost < budget * HEADROOM and level > FULL:
+            level -= 1
+        del self._steps[:]
+        del self._frames[:]
+        if level == self.level:
+            return None
+        self.level = level
+        self.changes += 1
+        return level
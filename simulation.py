@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# simulation.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Virtual-clock driver for the run loop.
+
+    The game animates a spirocore.Player with GLib timeouts, so a run
+    takes delay ms per segment of wall-clock time. VirtualScheduler
+    offers the same timeout_add/idle_add/source_remove calls against a
+    VirtualClock and runs every callback synchronously, so the same
+    state machine can be replayed in a fraction of a second.
+
+    Example:
+        view = simulate([1, 1, 1, 3, 2], [1, 1, 1, 3, 2])
+        view.success, len(view.segments), view.clock.now()
+
+"""
+import heapq
+
+import spirocore
+
+
+class VirtualClock:
+    ''' Milliseconds that only move when the scheduler says so '''
+
+    def __init__(self, start=0):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def advance_to(self, t):
+        if t > self._now:
+            self._now = t
+
+
+class VirtualScheduler:
+    ''' GLib-style timeouts run in due order against a VirtualClock '''
+
+    def __init__(self, clock=None):
+        if clock is None:
+            clock = VirtualClock()
+        self.clock = clock
+        self._queue = []
+        self._next_id = 1
+        self._removed = set()
+
+    def timeout_add(self, delay, callback, *args):
+        source = self._next_id
+        self._next_id += 1
+        heapq.heappush(self._queue, (self.clock.now() + delay, source, delay,
+                                     callback, args))
+        return source
+
+    def idle_add(self, callback, *args):
+        return self.timeout_add(0, callback, *args)
+
+    def source_remove(self, source):
+        self._removed.add(source)
+        return True
+
+    def pending(self):
+        return len(self._queue) - len(self._removed)
+
+    def run(self, until=None, max_callbacks=None):
+        ''' Fire callbacks in order, up to virtual time until (ms) '''
+        fired = 0
+        while self._queue:
+            due, source, delay, callback, args = self._queue[0]
+            if until is not None and due > until:
+                break
+            if max_callbacks is not None and fired >= max_callbacks:
+                break
+            heapq.heappop(self._queue)
+            if source in self._removed:
+                self._removed.discard(source)
+                continue
+            self.clock.advance_to(due)
+            fired += 1
+            if callback(*args):  # GLib repeats sources that return True
+                heapq.heappush(self._queue,
+                               (due + delay, source, delay, callback, args))
+        if until is not None:
+            self.clock.advance_to(until)
+        return fired
+
+
+class RecordingView:
+    ''' Stands in for the Gtk view; records what a run would draw '''
+
+    def __init__(self, goal, delay=500, clock=None):
+        self.goal = list(goal)
+        self.delay = delay
+        self.clock = clock
+        self.segments = []  # (x1, y1, x2, y2, heading)
+        self.layers = []  # (number index, glowing)
+        self.active_index = 0
+        self.splot = None  # (x, y, heading) where the turtle left the box
+        self.success = None  # None until the run completes
+
+    def run_step(self, step):
+        self.segments.append((step.x1, step.y1, step.x2, step.y2,
+                              step.heading))
+
+    def run_steps(self, steps):
+        for step in steps:
+            self.run_step(step)
+
+    def run_glow(self, index, on):
+        self.layers.append((index, on))
+        if on:
+            self.active_index = index
+
+    def run_splot(self, step):
+        self.splot = (step.x2, step.y2, step.heading)
+
+    def run_finish(self):
+        self.active_index = 0
+        self.success = spirocore.test_level(self.player.run.program,
+                                            self.goal)
+
+
+def simulate(program, goal, layout=None, delay=500, scheduler=None,
+             mode=None):
+    ''' Play one run to the end; return the RecordingView '''
+    if layout is None:
+        layout = spirocore.Layout(1200, 825, 75)
+    if scheduler is None:
+        scheduler = VirtualScheduler()
+    if mode is None:
+        mode = spirocore.Mode()
+    view = RecordingView(goal, delay=delay, clock=scheduler.clock)
+    x, y, dd = mode.starts(layout, goal)[1]
+    run = spirocore.Run(program, x, y, dd, bounds=layout.user_box(),
+                        angle=mode.angle)
+    view.player = spirocore.Player(view, scheduler, run)
+    view.player.start()
+    scheduler.run()
+    return view
+
+
+def replay_catalog(delay=500, layout=None, path=spirocore.PATTERNS):
+    ''' Solve every pattern in turn, as a student pressing 'Next' would
+
+    Returns a list of (pattern, view) and the virtual time it took.
+    '''
+    scheduler = VirtualScheduler()
+    results = []
+    pattern = 1
+    for n in range(len(spirocore.load_patterns(path))):
+        pattern, goal = spirocore.get_goal(pattern, path)
+        view = simulate(goal, goal, layout=layout, delay=delay,
+                        scheduler=scheduler)
+        results.append((pattern, view))
+        pattern = spirocore.next_pattern(pattern, path)
+    return results, scheduler.clock.now()
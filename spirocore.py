@@ -0,0 +1,691 @@
+# -*- coding: utf-8 -*-
+# spirocore.py
+"""
+    Copyright (C) 2014  Walter Bender
+    Copyright (C) 2010  Peter Hewitt
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    The Spirolaterals game without Gtk: the pattern catalog, the layout
+    geometry, the turtle path of a program and the run/win rules.
+
+    The classic game turns 90 degrees after each of 5 numbers and
+    repeats the program 4 times. A Mode can turn by any whole number of
+    degrees and have any number of digits; the repeats needed to close
+    the figure follow from the angle (see closing_loops). Headings are
+    looked up in a per-angle table of unit vectors, so a path costs two
+    additions per segment however long the program is.
+
+    Nothing here imports gi, cairo or sugar3, so tools, tests and batch
+    jobs can use the rules without a display server. Spirolaterals.py
+    is the Gtk view on top of this module.
+
+"""
+import math
+import os
+import random
+import time
+
+# artwork positions/scale in [landscape, portrait]
+BS = [400, 400]  # box scale
+X1 = [25, 25]  # left/top box position
+Y1 = [25, 25]
+X2 = [475, 25]  # right/bottom box position
+Y2 = [25, 475]
+NX = [475, 475]  # number cards position
+NY = [475, 475]
+NS = [75, 75]  # number cards size
+NO = [7, 7]  # offset between number cards
+TX = [200, 225]  # target turtle position
+TY = [350, 350]
+TS = [50, 50]  # target turtle line length
+UX = [650, 225]  # user turtle position
+UY = [350, 775]
+US = [50, 50]  # user turtle line length
+GY = [500, 950]  # position of success/failure graphics
+LS = [24, 24]  # font size for level indicator
+
+PATTERNS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'data', 'patterns.dat')
+DEFAULT_GOAL = [1, 1, 1, 3, 2]
+
+DIGITS = 5  # numbers in a program
+MAX_DIGIT = 5  # largest number on a card
+LOOPS = 4  # times the program is repeated
+HEADINGS = [(0, -1), (1, 0), (0, 1), (-1, 0)]  # up, right, down, left
+ANGLE = 90  # degrees turned (clockwise) after each number
+ANGLES = [90, 60, 72, 120, 45, 108, 135, 144]  # turns offered in the game
+MIN_DIGITS = 2
+MAX_DIGITS = 10
+GENERATED = 100  # patterns in the catalog of a non-classic mode
+FILL = 0.8  # share of the box a generated goal may cover
+BUDGET = 4  # ms of segments drawn per main loop turn at full speed
+
+_catalogs = {}
+_turn_tables = {ANGLE: HEADINGS}
+
+
+def load_patterns(path=PATTERNS):
+    ''' Return the goal programs in a pattern file (cached) '''
+    if path not in _catalogs:
+        patterns = []
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    patterns.append([int(c) for c in line[0:DIGITS]])
+        _catalogs[path] = patterns
+    return _catalogs[path]
+
+
+def get_goal(pattern, path=PATTERNS):
+    ''' Return (pattern, goal); unknown patterns fall back to pattern 1 '''
+    try:
+        patterns = load_patterns(path)
+    except (IOError, ValueError):
+        return 1, DEFAULT_GOAL[:]
+    if pattern < 1 or pattern > len(patterns):
+        return 1, patterns[0][:]
+    return pattern, patterns[pattern - 1][:]
+
+
+def next_pattern(pattern, path=PATTERNS):
+    ''' The pattern after this one, wrapping at the end of the catalog '''
+    try:
+        count = len(load_patterns(path))
+    except (IOError, ValueError):
+        return 1
+    if pattern >= count:
+        return 1
+    return pattern + 1
+
+
+def gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def turn_table(angle):
+    ''' Unit (dx, dy) of every heading reached by turning angle degrees
+
+    Heading h points h * angle degrees clockwise from straight up.
+    Multiples of 90 degrees get exact integers; tables are cached.
+    '''
+    angle %= 360
+    if angle not in _turn_tables:
+        table = []
+        for h in range(360 // gcd(angle, 360)):
+            a = math.radians(h * angle)
+            dx, dy = round(math.sin(a), 12), round(-math.cos(a), 12)
+            if dx == int(dx) and dy == int(dy):
+                dx, dy = int(dx), int(dy)
+            table.append((dx, dy))
+        _turn_tables[angle] = table
+    return _turn_tables[angle]
+
+
+def closing_loops(length, angle=ANGLE):
+    ''' Times a program of length numbers is repeated to close its figure
+
+    One pass turns length * angle degrees; the figure closes once the
+    passes add up to a whole number of turns. If one pass already is
+    a whole number of turns the figure never closes, and is drawn once.
+    '''
+    turn = length * angle % 360
+    return 360 // gcd(turn, 360)
+
+
+def generate_goal(pattern, length, angle):
+    ''' The goal of a pattern in a non-classic mode, the same every time '''
+    rng = random.Random(pattern * 1000003 + angle * 101 + length)
+    # not randint(), which picks differently from Python 3 on
+    return [1 + int(rng.random() * MAX_DIGIT) for i in range(length)]
+
+
+def extents(program, angle=ANGLE, loops=None):
+    ''' (left, top, right, bottom) of a figure drawn from (0, 0), dd 1 '''
+    left = top = right = bottom = 0
+    for x1, y1, x2, y2, h in segments(program, 0, 0, 1, loops, angle):
+        left = min(left, x2)
+        top = min(top, y2)
+        right = max(right, x2)
+        bottom = max(bottom, y2)
+    return left, top, right, bottom
+
+
+class Mode:
+    ''' Turn angle and program length of a game '''
+
+    def __init__(self, angle=ANGLE, length=DIGITS):
+        self.angle = angle
+        self.length = length
+
+    def classic(self):
+        return self.angle == ANGLE and self.length == DIGITS
+
+    def loops(self):
+        return closing_loops(self.length, self.angle)
+
+    def headings(self):
+        return len(turn_table(self.angle))
+
+    def get_goal(self, pattern, path=PATTERNS):
+        ''' (pattern, goal) from the catalog or, off-classic, generated '''
+        if self.classic():
+            return get_goal(pattern, path)
+        if pattern < 1 or pattern > GENERATED:
+            pattern = 1
+        return pattern, generate_goal(pattern, self.length, self.angle)
+
+    def count(self, path=PATTERNS):
+        ''' How many patterns the mode offers '''
+        if self.classic():
+            try:
+                return len(load_patterns(path))
+            except (IOError, ValueError):
+                return 1
+        return GENERATED
+
+    def next_pattern(self, pattern, path=PATTERNS):
+        if self.classic():
+            return next_pattern(pattern, path)
+        if pattern >= GENERATED:
+            return 1
+        return pattern + 1
+
+    def starts(self, layout, goal):
+        ''' (x, y, dd) of the target and of the user turtle
+
+        Classic games use the artwork positions. Other figures can
+        head off in any direction, so the goal is scaled and centred
+        to fit its box, and the user box uses the same placement.
+        '''
+        if self.classic():
+            return layout.target_start(), layout.user_start()
+        i = layout.i
+        x, y, dd = self._fit(goal, i)
+        return ((layout.sx(X1[i] + x), layout.sy(Y1[i] + y), layout.ss(dd)),
+                (layout.sx(X2[i] + x), layout.sy(Y2[i] + y), layout.ss(dd)))
+
+    def _fit(self, goal, i):
+        ''' (x, y, dd) in artwork units from the corner of the box '''
+        left, top, right, bottom = extents(goal, self.angle)
+        size = BS[i] * FILL
+        dd = min(float(TS[i]), size / max(right - left, bottom - top, 1))
+        x = BS[i] / 2. - (left + right) / 2. * dd
+        y = BS[i] / 2. - (top + bottom) / 2. * dd
+        return x, y, dd
+
+    def box_start(self, goal, i=0):
+        ''' (x, y, dd) of the target turtle as fractions of its box
+
+        The placement starts() gives, for drawing a goal in a box of
+        any size.
+        '''
+        if self.classic():
+            x, y, dd = TX[i] - X1[i], TY[i] - Y1[i], TS[i]
+        else:
+            x, y, dd = self._fit(goal, i)
+        return x / float(BS[i]), y / float(BS[i]), dd / float(BS[i])
+
+
+def test_level(program, goal):
+    ''' Does the program draw the goal? '''
+    return list(program) == list(goal)
+
+
+def scale_and_offset(width, height, i, toolbar):
+    ''' Scale and x offset of the artwork for orientation i '''
+    if i == 0:
+        scale = height / (900. - toolbar) * 1.25
+        offset = (width - (int((X1[i] + X2[i]) * scale) +
+                           int(BS[i] * scale))) / 2.
+    else:
+        scale = width / 900.
+        offset = (width - (int(X1[i] * scale) + int(BS[i] * scale))) / 2.
+    return scale, offset
+
+
+def orientation(width, height):
+    ''' 0 for landscape, 1 for portrait '''
+    if width < height:
+        return 1
+    return 0
+
+
+def card_scale(length):
+    ''' Long programs get smaller cards so they still fit the box '''
+    return min(1., float(DIGITS) / length)
+
+
+class Layout:
+    ''' Artwork geometry for a canvas of width x height
+
+    Everything the view places is scaled once here, so a Layout can be
+    kept per orientation and reused when the screen rotates back.
+    '''
+
+    def __init__(self, width, height, toolbar):
+        self.width = width
+        self.height = height
+        self.i = orientation(width, height)
+        self.scale, self.offset = scale_and_offset(width, height, self.i,
+                                                   toolbar)
+        i = self.i
+        self.box_size = self.ss(BS[i])
+        self.target_box = (self.sx(X1[i]), self.sy(Y1[i]))
+        self.user_box_xy = (self.sx(X2[i]), self.sy(Y2[i]))
+        self.results_y = self.sy(GY[i])
+        self.level_size = self.ss(LS[i])
+        self._target_start = (self.sx(TX[i]), self.sy(TY[i]), self.ss(TS[i]))
+        self._user_start = (self.sx(UX[i]), self.sy(UY[i]), self.ss(US[i]))
+        self._user_box = (self.sx(X2[i]), self.sy(Y2[i]),
+                          self.sx(X2[i] + BS[i]), self.sy(Y2[i] + BS[i]))
+        self._cards = {}  # length: (card size, [(x, y) per card])
+
+    def ss(self, f):  # scale size function
+        return int(f * self.scale)
+
+    def sx(self, f):  # scale x function
+        return int(f * self.scale + self.offset)
+
+    def sy(self, f):  # scale y function
+        return int(f * self.scale)
+
+    def target_start(self):
+        ''' (x, y, dd) where the target turtle starts '''
+        return self._target_start
+
+    def user_start(self):
+        ''' (x, y, dd) where the user turtle starts '''
+        return self._user_start
+
+    def user_box(self):
+        ''' (left, top, right, bottom) of the box the user draws in '''
+        return self._user_box
+
+    def _card_layout(self, length):
+        if length not in self._cards:
+            i = self.i
+            k = card_scale(length)
+            pitch = self.ss((NS[i] + NO[i]) * k)
+            x, y = self.sx(NX[i]), self.sy(NY[i])
+            if i == 0:
+                positions = [(x + n * pitch, y) for n in range(length)]
+            else:
+                positions = [(x, y + n * pitch) for n in range(length)]
+            self._cards[length] = (self.ss(NS[i] * k), positions)
+        return self._cards[length]
+
+    def card_size(self, length):
+        return self._card_layout(length)[0]
+
+    def card_positions(self, length):
+        ''' (x, y) of each card of a program of length numbers '''
+        return self._card_layout(length)[1]
+
+
+def segments(program, x, y, dd, loops=None, angle=ANGLE):
+    ''' Yield (x1, y1, x2, y2, heading) for every segment of a program
+
+    loops defaults to the repeats that close the figure.
+    '''
+    if loops is None:
+        loops = closing_loops(len(program), angle)
+    moves = [(dx * dd, dy * dd) for dx, dy in turn_table(angle)]
+    n = len(moves)
+    h = 0
+    for loop in range(loops):
+        for steps in program:
+            dx, dy = moves[h]
+            for k in range(steps):
+                x2 = x + dx
+                y2 = y + dy
+                yield x, y, x2, y2, h
+                x = x2
+                y = y2
+            h = (h + 1) % n
+
+
+def _grid(v):
+    ''' Round away float noise so equal points compare equal '''
+    if isinstance(v, float):
+        return round(v, 6) + 0.
+    return v
+
+
+def unit_segments(program, loops=None, angle=ANGLE):
+    ''' The figure of a program as a set of unit grid edges
+
+    Edges are ((x1, y1), (x2, y2)) in grid units from the start, with
+    the endpoints sorted so the direction of drawing doesn't matter.
+    '''
+    edges = set()
+    for x1, y1, x2, y2, h in segments(program, 0, 0, 1, loops, angle):
+        x1, y1, x2, y2 = _grid(x1), _grid(y1), _grid(x2), _grid(y2)
+        if (x1, y1) < (x2, y2):
+            edges.add(((x1, y1), (x2, y2)))
+        else:
+            edges.add(((x2, y2), (x1, y1)))
+    return edges
+
+
+def diff_segments(goal, program, loops=None, angle=ANGLE):
+    ''' (matched, missing, extra) edges of a program against the goal '''
+    wanted = unit_segments(goal, loops, angle)
+    drawn = unit_segments(program, loops, angle)
+    return wanted & drawn, wanted - drawn, drawn - wanted
+
+
+class Step:
+    ''' What happened in one step of a run '''
+
+    def __init__(self, x1, y1, x2, y2, heading, out, done_index, next_index,
+                 finished):
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+        self.heading = heading  # index of this segment's direction
+        self.out = out  # the segment left the box
+        self.done_index = done_index  # number finished by this step
+        self.next_index = next_index  # number the run moves on to
+        self.finished = finished  # last segment of the last loop
+
+
+class Run:
+    ''' A program being drawn one segment at a time '''
+
+    def __init__(self, program, x, y, dd, bounds=None, loops=None,
+                 angle=ANGLE):
+        self.program = list(program)
+        self.x = x
+        self.y = y
+        self.dd = dd
+        self.bounds = bounds  # (left, top, right, bottom) or None
+        if loops is None:
+            loops = closing_loops(len(self.program), angle)
+        self.loops = loops
+        self.angle = angle
+        self._moves = [(dx * dd, dy * dd) for dx, dy in turn_table(angle)]
+        self.heading = 0
+        self.loop = 0
+        self.step = 0
+        self.index = 0
+
+    def finished(self):
+        return self.loop >= self.loops
+
+    def advance(self):
+        ''' Take the next segment; return a Step '''
+        h = self.heading
+        dx, dy = self._moves[h]
+        x1, y1 = self.x, self.y
+        x2 = x1 + dx
+        y2 = y1 + dy
+        out = self.bounds is not None and (
+            x2 < self.bounds[0] or x2 > self.bounds[2] or
+            y2 < self.bounds[1] or y2 > self.bounds[3])
+        self.x, self.y = x2, y2
+
+        done_index = None
+        next_index = None
+        self.step += 1
+        if self.step == self.program[self.index]:
+            done_index = self.index
+            self.heading = (h + 1) % len(self._moves)
+            self.step = 0
+            self.index += 1
+            if self.index == len(self.program):
+                self.loop += 1
+                self.index = 0
+            if not self.finished():
+                next_index = self.index
+        return Step(x1, y1, x2, y2, h, out, done_index, next_index,
+                    self.finished())
+
+    def steps(self):
+        ''' Generator of the remaining Steps '''
+        while not self.finished():
+            yield self.advance()
+
+
+def trace(program, x, y, dd, bounds=None, loops=None, angle=ANGLE):
+    ''' The Steps of a run, up to and including any that leave the box '''
+    run = Run(program, x, y, dd, bounds=bounds, loops=loops, angle=angle)
+    steps = []
+    for step in run.steps():
+        steps.append(step)
+        if step.out:
+            break
+    return steps
+
+
+class Player:
+    ''' Animates a Run, one segment per scheduler timeout
+
+    The scheduler needs timeout_add(ms, callback), idle_add(callback)
+    and source_remove(id), as GLib has. The view provides a delay
+    attribute (ms per segment, read before every step so the speed
+    slider takes effect mid-run) and the callbacks run_step(step),
+    run_steps(steps), run_glow(index, on), run_splot(step) and
+    run_finish().
+
+    With no delay, segments are pulled from the run in chunks of
+    budget ms and handed to run_steps() together, with a trip through
+    the main loop between chunks, so input and redraws keep up however
+    long the program is. Number highlights then only follow the end
+    of each chunk.
+
+    pause() stops the timers without ending the run. resume() first
+    hands run_steps() every step the delay would have drawn in the
+    meantime, so the view catches up in one go.
+    '''
+
+    def __init__(self, view, scheduler, run, budget=BUDGET, clock=time.time):
+        self.view = view
+        self.scheduler = scheduler
+        self.run = run
+        self.budget = budget
+        self.running = False
+        self._clock = clock
+        self._steps = run.steps()
+        self._glowing = None
+        self._source = None
+        self._paused = None  # clock time of pause()
+
+    def start(self):
+        self.running = True
+        self._glowing = self.run.index
+        self.view.run_glow(self.run.index, True)
+        self._schedule()
+
+    def stop(self):
+        self.running = False
+        if self._source is not None:
+            self.scheduler.source_remove(self._source)
+            self._source = None
+
+    def pause(self):
+        if self._source is not None:
+            self.scheduler.source_remove(self._source)
+            self._source = None
+        if self._paused is None:
+            self._paused = self._clock()
+
+    def resume(self):
+        if self._paused is None:
+            return
+        paused, self._paused = self._paused, None
+        if not self.running or self.run.finished():
+            return
+        missed = 0
+        if self.view.delay > 0:
+            missed = int((self._clock() - paused) * 1000 / self.view.delay)
+        if missed > 0:
+            steps = []
+            for step in self._steps:
+                steps.append(step)
+                if step.out or step.finished or len(steps) >= missed:
+                    break
+            self.view.run_steps(steps)
+            self._after(steps[-1])
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        if self.view.delay > 0:
+            self._source = self.scheduler.timeout_add(self.view.delay,
+                                                      self._tick)
+        else:
+            self._source = self.scheduler.idle_add(self._tick)
+
+    def _chunk(self):
+        ''' Steps until the budget is spent or the run stops '''
+        deadline = self._clock() + self.budget / 1000.
+        steps = []
+        for step in self._steps:
+            steps.append(step)
+            if step.out or step.finished or self._clock() >= deadline:
+                break
+        return steps
+
+    def _tick(self):
+        self._source = None
+        if not self.running or self.run.finished():
+            return False
+        if self.view.delay > 0:
+            step = next(self._steps)
+            self.view.run_step(step)
+        else:
+            steps = self._chunk()
+            self.view.run_steps(steps)
+            step = steps[-1]
+        self._after(step)
+        return False
+
+    def _after(self, step):
+        ''' Glow, splot or finish after step was drawn; schedule the next '''
+        if step.out:
+            self.running = False
+            self.view.run_splot(step)
+        current = None
+        if not self.run.finished():
+            current = self.run.index
+        if current != self._glowing:
+            self.view.run_glow(self._glowing, False)
+            if current is not None:
+                self.view.run_glow(current, True)
+            self._glowing = current
+        if step.finished:
+            self.running = False
+            self.view.run_finish()
+        elif self.running:
+            self._schedule()
+
+
+class SharedPlayer:
+    ''' Animates several Runs side by side on one scheduler timeout
+
+    Every tick takes the next segment of each run still going, or at
+    full speed deals segments out to the runs in turn until budget ms
+    are spent. They are handed to view.compare_steps(batch) together,
+    batch being [(run index, [Step])], so a tick costs what its
+    segments cost however many runs there are. A run stops when it
+    finishes or leaves its bounds; once none is left,
+    view.compare_finish(last) gets the last Step of each run.
+
+    The view provides delay as for Player, and stop(), pause() and
+    resume() work the same way.
+    '''
+
+    def __init__(self, view, scheduler, runs, budget=BUDGET,
+                 clock=time.time):
+        self.view = view
+        self.scheduler = scheduler
+        self.runs = runs
+        self.budget = budget
+        self.running = False
+        self._clock = clock
+        self._steps = [run.steps() for run in runs]
+        self._last = [None] * len(runs)
+        self._going = list(range(len(runs)))
+        self._source = None
+        self._paused = None
+
+    def start(self):
+        self.running = True
+        self._schedule()
+
+    def stop(self):
+        self.running = False
+        if self._source is not None:
+            self.scheduler.source_remove(self._source)
+            self._source = None
+
+    def pause(self):
+        if self._source is not None:
+            self.scheduler.source_remove(self._source)
+            self._source = None
+        if self._paused is None:
+            self._paused = self._clock()
+
+    def resume(self):
+        if self._paused is None:
+            return
+        paused, self._paused = self._paused, None
+        if not self.running:
+            return
+        missed = 0
+        if self.view.delay > 0:
+            missed = int((self._clock() - paused) * 1000 / self.view.delay)
+        if missed > 0:
+            batch = {}
+            for i in range(missed):
+                if not self._going:
+                    break
+                self._round(batch)
+            self._deliver(batch)
+        else:
+            self._schedule()
+
+    def _schedule(self):
+        if self.view.delay > 0:
+            self._source = self.scheduler.timeout_add(self.view.delay,
+                                                      self._tick)
+        else:
+            self._source = self.scheduler.idle_add(self._tick)
+
+    def _round(self, batch):
+        ''' One segment from each run still going, into batch '''
+        for i in list(self._going):
+            step = next(self._steps[i])
+            batch.setdefault(i, []).append(step)
+            self._last[i] = step
+            if step.out or step.finished:
+                self._going.remove(i)
+
+    def _tick(self):
+        self._source = None
+        if not self.running:
+            return False
+        batch = {}
+        self._round(batch)
+        if self.view.delay <= 0:
+            deadline = self._clock() + self.budget / 1000.
+            while self._going and self._clock() < deadline:
+                self._round(batch)
+        self._deliver(batch)
+        return False
+
+    def _deliver(self, batch):
+        self.view.compare_steps(sorted(batch.items()))
+        if self._going:
+            self._schedule()
+        else:
+            self.running = False
+            self.view.compare_finish(self._last)
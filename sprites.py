@@ -76,11 +76,47 @@ def svg_str_to_pixbuf(svg_string):
 
 '''
 
-import gi
-from gi.repository import Gtk, GdkPixbuf, Gdk
+import weakref
+from collections import namedtuple
+
+from gi.repository import Gdk
 from gi.repository import Pango, PangoCairo
 import cairo
 
+import tracing
+
+# A surface or pixbuf holding pixel memory, for Sprites.surfaces()
+SurfaceUse = namedtuple('SurfaceUse',
+                        'owner width height format bytes surface')
+
+_FORMATS = {cairo.FORMAT_ARGB32: 'ARGB32', cairo.FORMAT_RGB24: 'RGB24',
+            cairo.FORMAT_A8: 'A8', cairo.FORMAT_A1: 'A1'}
+
+
+def surface_use(surface, owner, width=None, height=None):
+    ''' Describe an ImageSurface, a GdkPixbuf or another cairo surface
+
+    Surfaces that can't tell their size (such as those made by
+    create_similar on a window) need width and height, and are
+    counted at four bytes a pixel.
+    '''
+    if hasattr(surface, 'get_rowstride'):
+        if surface.get_has_alpha():
+            format = 'pixbuf RGBA'
+        else:
+            format = 'pixbuf RGB'
+        return SurfaceUse(owner, surface.get_width(), surface.get_height(),
+                          format,
+                          surface.get_rowstride() * surface.get_height(),
+                          surface)
+    if isinstance(surface, cairo.ImageSurface):
+        return SurfaceUse(owner, surface.get_width(), surface.get_height(),
+                          _FORMATS.get(surface.get_format(), 'other'),
+                          surface.get_stride() * surface.get_height(),
+                          surface)
+    return SurfaceUse(owner, width, height, 'similar', width * height * 4,
+                      surface)
+
 
 class Sprites:
     ''' A class for the list of sprites and everything they share in common '''
@@ -91,6 +127,7 @@ class Sprites:
         self._widget = widget
         self._delay = False
         self.list = []
+        self._every = weakref.WeakSet()  # hidden sprites too
 
     def set_cairo_context(self, cr):
         ''' Cairo context may be set or reset after __init__ '''
@@ -110,6 +147,7 @@ class Sprites:
     def append_to_list(self, spr):
         ''' Append a new sprite to the end of the list. '''
         self.list.append(spr)
+        self._every.add(spr)
 
     def insert_in_list(self, spr, i):
         ''' Insert a sprite at position i. '''
@@ -125,6 +163,24 @@ class Sprites:
         if spr in self.list:
             self.list.remove(spr)
 
+    def surfaces(self, seen=None):
+        ''' SurfaceUse of every image and mask of the live sprites
+
+        Shown or hidden, each surface is listed once, however many
+        sprites share it; ids in seen are skipped and new ones added.
+        '''
+        if seen is None:
+            seen = set()
+        uses = []
+        for spr in list(self._every):
+            owner = spr.type or 'sprite'
+            masks = [mask[0] for mask in spr.masks if mask is not None]
+            for surface in spr.cached_surfaces + masks:
+                if surface is not None and id(surface) not in seen:
+                    seen.add(id(surface))
+                    uses.append(surface_use(surface, owner))
+        return uses
+
     def find_sprite(self, pos):
         ''' Search based on (x, y) position. Return the 'top/first' one. '''
         list = self.list[:]
@@ -134,6 +190,7 @@ class Sprites:
                 return spr
         return None
 
+    @tracing.traced('redraw sprites')
     def redraw_sprites(self, area=None, cr=None):
         ''' Redraw the sprites that intersect area. '''
         # I think I need to do this to save Cairo some work
@@ -144,13 +201,19 @@ class Sprites:
         if cr is None:
             print 'sprites.redraw_sprites: no Cairo context'
             return
+        if area is not None and hasattr(area, 'width'):
+            area = (area.x, area.y, area.width, area.height)
+        drawn = 0
         for spr in self.list:
             if area == None:
                 spr.draw(cr=cr)
-            else:
-                intersection = spr.rect.intersect(area)
-                if intersection.width > 0 or intersection.height > 0:
-                    spr.draw(cr=cr)
+                drawn += 1
+            elif spr.intersects(area):
+                spr.draw(cr=cr)
+                drawn += 1
+        if tracing.enabled:
+            tracing.count('sprites drawn', drawn)
+        return drawn
 
     def set_delay(self, delay):
         self._delay = delay
@@ -158,6 +221,9 @@ class Sprites:
     def invalidate_area(self, x, y, width, height):
         if self._delay:
             return
+        if tracing.enabled:
+            tracing.count('invalidations')
+            tracing.count('invalidated pixels', width * height)
         self._widget.queue_draw_area(x, y, width, height)
 
     def draw_all(self):
@@ -187,6 +253,7 @@ class Sprite:
         self.layer = 100
         self.labels = []
         self.cached_surfaces = []
+        self.masks = []  # (alpha mask, rgb) tinting each image, or None
         self._dx = []  # image offsets
         self._dy = []
         self.type = None
@@ -197,10 +264,12 @@ class Sprite:
         ''' Add an image to the sprite. '''
         while len(self.cached_surfaces) < i + 1:
             self.cached_surfaces.append(None)
+            self.masks.append(None)
             self._dx.append(0)
             self._dy.append(0)
         self._dx[i] = dx
         self._dy[i] = dy
+        self.masks[i] = None
         if hasattr(image, 'get_width'):
             w = image.get_width()
             h = image.get_height()
@@ -225,6 +294,21 @@ class Sprite:
             context.fill()
             self.cached_surfaces[i] = surface
 
+    def set_mask(self, mask, color, i=0):
+        ''' Tint image i: color is added through an alpha mask when drawn
+
+        With the image rendered in black where the color goes, this
+        draws the image in any color without rasterizing it again.
+        '''
+        self.masks[i] = (mask, _rgb(color))
+        self.inval()
+
+    def set_tint(self, color, i=0):
+        ''' Change the color of a masked image '''
+        if self.masks[i] is not None:
+            self.masks[i] = (self.masks[i][0], _rgb(color))
+            self.inval()
+
     def move(self, pos):
         ''' Move to new (x, y) position '''
         self.inval()
@@ -357,6 +441,15 @@ class Sprite:
                          self.rect[2],
                          self.rect[3])
             cr.fill()
+            if self.masks[i] is not None:
+                mask, rgb = self.masks[i]
+                cr.save()
+                # the black image already set the alpha; add the color
+                cr.set_operator(cairo.OPERATOR_ADD)
+                cr.set_source_rgb(rgb[0], rgb[1], rgb[2])
+                cr.mask_surface(mask, self.rect[0] + self._dx[i],
+                                self.rect[1] + self._dy[i])
+                cr.restore()
 
         if len(self.labels) > 0:
             self.draw_label(cr)
@@ -374,6 +467,15 @@ class Sprite:
             return False
         return True
 
+    def intersects(self, area):
+        ''' Does the (x, y, w, h) area overlap the sprite? '''
+        x, y, w, h = area
+        if x >= self.rect[0] + self.rect[2] or x + w <= self.rect[0]:
+            return False
+        if y >= self.rect[1] + self.rect[3] or y + h <= self.rect[1]:
+            return False
+        return True
+
     def draw_label(self, cr):
         ''' Draw the label based on its attributes '''
         my_width = self.rect[2] - self._margins[0] - self._margins[2]
@@ -471,3 +573,10 @@ class Sprite:
         except IndexError:
             print "Index Error: %d %d" % (len(array), offset)
             return(-1, -1, -1, -1)
+
+
+def _rgb(color):
+    ''' Convert '#RRGGBB' to floats '''
+    return (int(color[1:3], 16) / 255.,
+            int(color[3:5], 16) / 255.,
+            int(color[5:7], 16) / 255.)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# test_bench.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Run with: python -m unittest discover tests
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+try:
+    import bench
+    import Spirolaterals
+except ImportError:
+    bench = None
+
+
+@unittest.skipIf(bench is None, 'needs cairo, Gtk and sugar3')
+class BenchTest(unittest.TestCase):
+    ''' The benchmarks build the real game; keep them from going stale '''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_smoke(self):
+        output = os.path.join(self.tmp, 'results.json')
+        self.assertEqual(bench.main(['--smoke', '--output', output]), 0)
+        with open(output) as f:
+            results = json.load(f)['results']
+        for name in ['sprites.redraw_full[n=50]', 'core.hint',
+                     'game.draw_goal[all]', 'game.draw_trace[all]']:
+            self.assertTrue(name in results, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
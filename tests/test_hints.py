@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# test_hints.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Run with: python -m unittest discover tests
+
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import hints
+from hints import HintIndex
+import spirocore
+
+GOAL = [1, 1, 1, 3, 2]
+
+
+class IndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.catalog = os.path.join(self.tmp, 'patterns.dat')
+        with open(self.catalog, 'w') as f:
+            f.write('11132\n24142\n')
+        self.path = os.path.join(self.tmp, 'hints.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_program_index(self):
+        for k in range(hints.PROGRAMS):
+            self.assertEqual(hints.program_index(hints.index_program(k)), k)
+
+    def test_build_in_chunks(self):
+        index = HintIndex(path=self.path, catalog=self.catalog)
+        self.assertEqual(index.row(GOAL), None)
+        chunks = 1
+        while index.build(GOAL):
+            chunks += 1
+        self.assertEqual(chunks, hints.PROGRAMS // hints.CHUNK)
+        row = index.row(GOAL)
+        self.assertEqual(row, hints.build_row(GOAL))
+        self.assertEqual(row[hints.program_index(GOAL)], 255)
+
+    def test_file_round_trip(self):
+        self.assertEqual(hints.write_index(self.path, self.catalog), 2)
+        rows = hints.read_index(self.path, self.catalog)
+        self.assertEqual(sorted(rows), [(1, 1, 1, 3, 2), (2, 4, 1, 4, 2)])
+        self.assertEqual(rows[tuple(GOAL)], hints.build_row(GOAL))
+
+    def test_stale_file(self):
+        hints.write_index(self.path, self.catalog)
+        with open(self.catalog, 'a') as f:
+            f.write('55555\n')
+        self.assertEqual(hints.read_index(self.path, self.catalog), {})
+
+    def test_missing_file(self):
+        self.assertEqual(hints.read_index(self.path, self.catalog), {})
+
+
+class HintTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = HintIndex(path=os.devnull)
+
+    def test_solved(self):
+        self.assertEqual(self.index.hint(GOAL, GOAL), None)
+
+    def test_hint_changes_one_digit(self):
+        program = [5, 4, 3, 2, 1]
+        i, digit = self.index.hint(program, GOAL)
+        self.assertNotEqual(program[i], digit)
+        self.assertTrue(1 <= digit <= spirocore.MAX_DIGIT)
+
+    def test_hints_end_at_the_goal(self):
+        while self.index.build(GOAL):
+            pass
+        row = self.index.row(GOAL)
+        elsewhere = 0
+        for k in range(hints.PROGRAMS):
+            program = hints.index_program(k)
+            for n in range(hints.PROGRAMS):
+                hint = self.index.hint(program, GOAL)
+                if hint is None:
+                    break
+                i, digit = hint
+                before = row[hints.program_index(program)]
+                program[i] = digit
+                after = row[hints.program_index(program)]
+                if digit != GOAL[i]:
+                    elsewhere += 1
+                    self.assertTrue(after > before)
+            self.assertEqual(program, GOAL)
+        self.assertTrue(elsewhere > 0)  # not every hint gives a digit away
+
+    def test_row_and_direct_scores_agree(self):
+        program = [2, 2, 3, 1, 5]
+        direct = self.index.hint(program, GOAL)
+        while self.index.build(GOAL):
+            pass
+        self.assertEqual(self.index.hint(program, GOAL), direct)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# test_history.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Run with: python -m unittest discover tests
+
+"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import history
+from history import History
+
+
+class Clock:
+    ''' Seconds that move on by step at every call '''
+
+    def __init__(self, start=1400000000, step=3):
+        self.t = start - step
+        self.step = step
+
+    def __call__(self):
+        self.t += self.step
+        return self.t
+
+
+def _history(attempts, clock=None):
+    h = History(clock=clock or Clock())
+    for attempt in attempts:
+        h.add(*attempt)
+    return h
+
+
+ATTEMPTS = [(90, 1, [1, 1, 1, 3, 2], history.SOLVED, 1200),
+            (90, 2, [5, 4, 3, 2, 1], history.FAILED, 300000),
+            (90, 2, [1, 2, 3, 4, 5], history.SPLOT, 0),
+            (60, 7, [1, 2, 3], history.STOPPED, 45),
+            (90, 3, [2, 2, 2, 2, 2], history.SOLVED, 5)]
+
+
+class VarintTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        numbers = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 31, 2 ** 40 + 7]
+        data = bytearray()
+        for n in numbers:
+            history.put_varint(data, n)
+        offset = 0
+        for n in numbers:
+            m, offset = history.get_varint(data, offset)
+            self.assertEqual(m, n)
+        self.assertEqual(offset, len(data))
+
+    def test_small_numbers_take_a_byte(self):
+        data = bytearray()
+        history.put_varint(data, 127)
+        self.assertEqual(len(data), 1)
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        h = _history(ATTEMPTS)
+        again = History()
+        self.assertTrue(again.load(h.to_bytes()))
+        self.assertEqual(again.attempts(), h.attempts())
+        self.assertEqual([(a.angle, a.pattern, a.program, a.outcome, a.ms)
+                          for a in again.attempts()],
+                         [(angle, pattern, program, outcome, ms)
+                          for angle, pattern, program, outcome, ms
+                          in ATTEMPTS])
+
+    def test_sessions_append(self):
+        first = _history(ATTEMPTS[:2])
+        second = History(clock=Clock(start=1500000000))
+        second.load(first.to_bytes())
+        for attempt in ATTEMPTS[2:]:
+            second.add(*attempt)
+        third = History()
+        third.load(second.to_bytes())
+        self.assertEqual(third.attempts(), second.attempts())
+        self.assertEqual(len(third.attempts()), len(ATTEMPTS))
+
+    def test_clock_going_back(self):
+        h = _history(ATTEMPTS, clock=Clock(step=-10))
+        again = History()
+        again.load(h.to_bytes())
+        self.assertEqual(again.attempts(), h.attempts())
+
+    def test_not_a_history(self):
+        h = History()
+        self.assertFalse(h.load(b'PNG not a history'))
+        self.assertEqual(h.attempts(), [])
+
+    def test_truncated(self):
+        data = _history(ATTEMPTS).to_bytes()
+        h = History()
+        h.load(data[:-1])
+        self.assertEqual(h.attempts(), _history(ATTEMPTS).attempts()[:-1])
+
+    def test_solved(self):
+        h = _history(ATTEMPTS)
+        self.assertEqual(h.solved(90, 5), set([1, 3]))
+        self.assertEqual(h.solved(60, 3), set())
+
+
+class ReadAttemptsTest(unittest.TestCase):
+
+    def test_chunks(self):
+        h = _history(ATTEMPTS * 20)
+        data = h.to_bytes()
+        for size in [1, 2, 3, 7, 64, history.CHUNK]:
+            attempts = list(history.read_attempts(io.BytesIO(data), size))
+            self.assertEqual(attempts, h.attempts())
+
+    def test_truncated(self):
+        h = _history(ATTEMPTS)
+        data = h.to_bytes()[:-1]
+        attempts = list(history.read_attempts(io.BytesIO(data), 3))
+        self.assertEqual(attempts, h.attempts()[:-1])
+
+    def test_not_a_history(self):
+        self.assertEqual(
+            list(history.read_attempts(io.BytesIO(b'nothing here'))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# test_spirocore.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Run with: python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import spirocore
+import simulation
+
+
+class CatalogTest(unittest.TestCase):
+
+    def test_replay_catalog(self):
+        results, ms = simulation.replay_catalog(delay=500)
+        self.assertEqual(len(results), 122)
+        solved = [pattern for pattern, view in results if view.success]
+        self.assertEqual(len(solved), 122)
+        for pattern, view in results:
+            self.assertEqual(view.splot, None)
+            self.assertEqual(view.active_index, 0)
+        segments = sum([len(view.segments) for pattern, view in results])
+        self.assertEqual(ms, segments * 500)
+
+    def test_next_pattern_visits_every_pattern(self):
+        patterns = set()
+        pattern = 1
+        for i in range(len(spirocore.load_patterns())):
+            pattern, goal = spirocore.get_goal(pattern)
+            patterns.add(pattern)
+            pattern = spirocore.next_pattern(pattern)
+        self.assertEqual(len(patterns), 122)
+
+
+class RunTest(unittest.TestCase):
+
+    def test_run_matches_segments(self):
+        program = [1, 1, 1, 3, 2]
+        run = spirocore.Run(program, 10, 20, 5)
+        drawn = [(s.x1, s.y1, s.x2, s.y2, s.heading) for s in run.steps()]
+        self.assertEqual(drawn, list(spirocore.segments(program, 10, 20, 5)))
+        self.assertEqual(len(drawn), sum(program) * spirocore.LOOPS)
+
+    def test_figure_closes(self):
+        for angle in spirocore.ANGLES:
+            for length in range(spirocore.MIN_DIGITS,
+                                spirocore.MAX_DIGITS + 1):
+                program = spirocore.generate_goal(1, length, angle)
+                if length * angle % 360 == 0:
+                    continue  # drawn once, never closes
+                x1, y1, x2, y2, h = list(spirocore.segments(
+                    program, 0, 0, 1, angle=angle))[-1]
+                self.assertAlmostEqual(x2, 0, 6)
+                self.assertAlmostEqual(y2, 0, 6)
+
+    def test_splot(self):
+        layout = spirocore.Layout(1200, 825, 75)
+        view = simulation.simulate([5, 5, 5, 5, 5], [1, 1, 1, 3, 2],
+                                   layout=layout)
+        self.assertNotEqual(view.splot, None)
+        self.assertEqual(view.success, None)
+
+    def test_failure(self):
+        view = simulation.simulate([1, 2, 1, 2, 1], [1, 1, 1, 3, 2])
+        self.assertEqual(view.splot, None)
+        self.assertEqual(view.success, False)
+
+    def test_diff_segments(self):
+        goal = [1, 1, 1, 3, 2]
+        matched, missing, extra = spirocore.diff_segments(goal, goal)
+        self.assertEqual(matched, spirocore.unit_segments(goal))
+        self.assertEqual(missing, set())
+        self.assertEqual(extra, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# test_timeline.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Run with: python -m unittest discover tests
+
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+try:
+    import cairo
+    from timeline import Timeline
+except ImportError:
+    cairo = None
+import spirocore
+
+SIZE = 200
+BOUNDS = (20, 20, 180, 180)
+REGION = (10, 10, 180, 180)
+
+
+def _trace(program=(1, 1, 1, 3, 2)):
+    return spirocore.trace(list(program), 100, 100, 10, bounds=BOUNDS)
+
+
+@unittest.skipIf(cairo is None, 'pycairo is not installed')
+class TimelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.canvas = cairo.ImageSurface(cairo.FORMAT_RGB24, SIZE, SIZE)
+        self.cr = cairo.Context(self.canvas)
+        self.cr.set_source_rgb(1, 1, 1)
+        self.cr.paint()
+        self.cr.set_source_rgb(0, 0, 1)
+        self.cr.set_line_width(4)
+        self.drawn = []
+
+    def _draw(self, step):
+        self.drawn.append(step)
+        self.cr.move_to(step.x1, step.y1)
+        self.cr.line_to(step.x2, step.y2)
+        self.cr.stroke()
+
+    def _pixels(self):
+        self.canvas.flush()
+        return bytes(self.canvas.get_data())
+
+    def _live(self, timeline):
+        ''' Draw every step as a run would; return the pixels after each '''
+        timeline.capture(self.cr, 0)
+        pixels = [self._pixels()]
+        for step in timeline.steps:
+            self._draw(step)
+            timeline.advance(self.cr)
+            pixels.append(self._pixels())
+        return pixels
+
+    def test_seek_matches_live_run(self):
+        timeline = Timeline(_trace(), REGION, 4, interval=4)
+        pixels = self._live(timeline)
+        self.assertEqual(timeline.position, len(timeline))
+        for index in [0, 3, 4, 9, len(timeline), 1, len(timeline) - 1]:
+            timeline.seek(index, self.cr, self._draw)
+            self.assertEqual(timeline.position, index)
+            self.assertEqual(self._pixels(), pixels[index])
+
+    def test_seek_replays_from_the_nearest_checkpoint(self):
+        timeline = Timeline(_trace(), REGION, 4, interval=4)
+        self._live(timeline)
+        del self.drawn[:]
+        timeline.seek(11, self.cr, self._draw)
+        self.assertEqual(self.drawn, timeline.steps[8:11])
+
+    def test_trim_keeps_the_base(self):
+        timeline = Timeline(_trace(), REGION, 4, interval=4)
+        pixels = self._live(timeline)
+        self.assertTrue(timeline.bytes > 0)
+        timeline.trim()
+        self.assertEqual(timeline.bytes, 0)
+        self.assertEqual(len(timeline.surfaces()), 1)
+        del self.drawn[:]
+        timeline.seek(10, self.cr, self._draw)
+        self.assertEqual(len(self.drawn), 10)
+        self.assertEqual(self._pixels(), pixels[10])
+
+    def test_max_bytes(self):
+        timeline = Timeline(_trace(), REGION, 4, interval=2, max_bytes=1)
+        self._live(timeline)
+        self.assertEqual(len(timeline.surfaces()), 2)  # base and one
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# timeline.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    A precomputed run with canvas checkpoints, so that any step can be
+    shown without redrawing from the start.
+
+    The first checkpoint holds the whole user box before anything is
+    drawn. Later checkpoints, taken every INTERVAL segments, hold only
+    the bounding box of the segments drawn so far: outside it the
+    canvas still matches the first checkpoint. They are evicted least
+    recently used first once they hold more than MAX_BYTES of pixels.
+
+    Regions are in the canvas context's user space. A context scaled
+    onto a smaller surface (see quality.LOW_RES) gets snapshots at that
+    surface's resolution, and each is painted back at its own scale.
+
+"""
+import math
+from collections import OrderedDict
+
+import cairo
+
+INTERVAL = 8  # segments between checkpoints
+MAX_BYTES = 8 * 1024 * 1024  # pixel memory for checkpoints after the first
+
+
+class Timeline:
+    ''' The steps of a run and snapshots of the canvas along the way '''
+
+    def __init__(self, steps, region, margin, interval=INTERVAL,
+                 max_bytes=MAX_BYTES):
+        self.steps = steps
+        self.position = 0  # segments currently on the canvas
+        self.bytes = 0
+        self._region = region  # (x, y, w, h) covering every segment
+        self._margin = margin  # pen overhang around a segment
+        self._interval = interval
+        self._max_bytes = max_bytes
+        self._base = None
+        self._snapshots = OrderedDict()
+        self._extents = [None]
+        extent = None
+        for step in steps:
+            x1, x2 = sorted((step.x1, step.x2))
+            y1, y2 = sorted((step.y1, step.y2))
+            if extent is None:
+                extent = (x1, y1, x2, y2)
+            else:
+                extent = (min(extent[0], x1), min(extent[1], y1),
+                          max(extent[2], x2), max(extent[3], y2))
+            self._extents.append(extent)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def _crop(self, index):
+        ''' Canvas area that differs from the base after index segments '''
+        x1, y1, x2, y2 = self._extents[index]
+        m = self._margin
+        rx, ry, rw, rh = self._region
+        x = int(math.floor(max(x1 - m, rx)))
+        y = int(math.floor(max(y1 - m, ry)))
+        return (x, y, int(math.ceil(min(x2 + m, rx + rw))) - x,
+                int(math.ceil(min(y2 + m, ry + rh))) - y)
+
+    def _copy(self, cr, x, y, w, h):
+        ''' (x, y, w, h, scale, surface) of a region of cr's target '''
+        scale = cr.get_matrix()[0]
+        canvas = cr.get_target()
+        surface = canvas.create_similar(
+            cairo.CONTENT_COLOR, int(math.ceil(w * scale)),
+            int(math.ceil(h * scale)))
+        copy = cairo.Context(surface)
+        copy.set_source_surface(canvas, -x * scale, -y * scale)
+        copy.paint()
+        return (x, y, w, h, scale, surface)
+
+    def _pixels(self, snapshot):
+        x, y, w, h, scale, surface = snapshot
+        return int(math.ceil(w * scale)), int(math.ceil(h * scale))
+
+    def _bytes(self, snapshot):
+        w, h = self._pixels(snapshot)
+        return w * h * 4
+
+    def surfaces(self):
+        ''' (surface, width, height) of every snapshot, sizes in pixels '''
+        snapshots = list(self._snapshots.values())
+        if self._base is not None:
+            snapshots.insert(0, self._base)
+        return [(snapshot[-1],) + self._pixels(snapshot)
+                for snapshot in snapshots]
+
+    def trim(self):
+        ''' Drop the checkpoints after the first; seek() redraws instead '''
+        self._snapshots.clear()
+        self.bytes = 0
+
+    def capture(self, cr, index):
+        ''' Snapshot the canvas as it is after index segments '''
+        if index == 0:
+            self._base = self._copy(cr, *self._region)
+            return
+        x, y, w, h = self._crop(index)
+        if w <= 0 or h <= 0 or index in self._snapshots:
+            return
+        self._snapshots[index] = self._copy(cr, x, y, w, h)
+        self.bytes += self._bytes(self._snapshots[index])
+        while self.bytes > self._max_bytes and len(self._snapshots) > 1:
+            i, snapshot = self._snapshots.popitem(last=False)
+            self.bytes -= self._bytes(snapshot)
+
+    def checkpoint_due(self):
+        ''' Will the next advance() take a snapshot? '''
+        return (self.position + 1) % self._interval == 0
+
+    def advance(self, cr):
+        ''' A live run has drawn the next segment '''
+        self.position += 1
+        if self.position % self._interval == 0:
+            self.capture(cr, self.position)
+
+    def seek(self, index, cr, draw):
+        ''' Make the canvas show index segments; draw(step) replays one '''
+        index = max(0, min(index, len(self.steps)))
+        start = 0
+        for i in self._snapshots:
+            if start < i <= index:
+                start = i
+        self._paint(cr, self._base)
+        if start > 0:
+            snapshot = self._snapshots.pop(start)
+            self._snapshots[start] = snapshot  # most recently used
+            self._paint(cr, snapshot)
+        for i in range(start, index):
+            draw(self.steps[i])
+            if (i + 1) % self._interval == 0:
+                self.capture(cr, i + 1)
+        self.position = index
+
+    def _paint(self, cr, snapshot):
+        x, y, w, h, scale, surface = snapshot
+        cr.save()
+        cr.rectangle(x, y, w, h)
+        cr.clip()
+        cr.translate(x, y)
+        cr.scale(1. / scale, 1. / scale)
+        cr.set_source_surface(surface, 0, 0)
+        cr.paint()
+        cr.restore()
+
+    def region(self):
+        return self._region
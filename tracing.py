@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# tracing.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Switchable timing spans and per-frame counters.
+
+    Set SPIROLATERALS_TRACE to a file name to turn tracing on. Spans
+    and counters are written there on exit in the Chrome trace-event
+    format (open it with chrome://tracing or https://ui.perfetto.dev).
+
+    When the variable is unset, traced() hands back the undecorated
+    function and callers guard counters with 'if tracing.enabled:', so
+    the instrumentation costs next to nothing.
+
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+TRACE_ENV = 'SPIROLATERALS_TRACE'
+MAX_EVENTS = 1000000  # stop recording rather than exhaust memory
+
+_path = os.environ.get(TRACE_ENV)
+enabled = bool(_path)
+
+_events = []
+_counters = {}
+_pid = os.getpid()
+_start = time.time()
+
+
+def _now():
+    ''' Microseconds since the module was loaded '''
+    return (time.time() - _start) * 1e6
+
+
+def _add(event):
+    if len(_events) < MAX_EVENTS:
+        event['pid'] = _pid
+        event['tid'] = threading.current_thread().ident
+        _events.append(event)
+
+
+def traced(name):
+    ''' Decorator: record a span around every call when tracing is on '''
+    def decorator(fn):
+        if not enabled:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            start = _now()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _add({'name': name, 'ph': 'X', 'ts': start,
+                      'dur': _now() - start})
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+
+class span:
+    ''' Context manager for spans that do not line up with a function '''
+
+    def __init__(self, name):
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        if enabled:
+            self._start = _now()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if enabled:
+            _add({'name': self._name, 'ph': 'X', 'ts': self._start,
+                  'dur': _now() - self._start})
+        return False
+
+
+def count(name, value=1):
+    ''' Add value to a counter; reported and reset by frame() '''
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def frame():
+    ''' Emit the counters accumulated since the previous frame '''
+    if not _counters:
+        return
+    _add({'name': 'frame', 'ph': 'C', 'ts': _now(),
+          'args': dict(_counters)})
+    _counters.clear()
+
+
+class PhaseTimer:
+    ''' Wall-clock breakdown of a sequence of phases, e.g. startup '''
+
+    def __init__(self, name):
+        self._name = name
+        self._start = time.time()
+        self._last = self._start
+        self.phases = []
+
+    def mark(self, phase):
+        ''' Close the phase that has been running since the last mark '''
+        now = time.time()
+        self.phases.append((phase, now - self._last))
+        if enabled:
+            _add({'name': phase, 'ph': 'X', 'ts': (self._last - _start) * 1e6,
+                  'dur': (now - self._last) * 1e6})
+        self._last = now
+
+    def total(self):
+        return self._last - self._start
+
+    def report(self):
+        logging.debug('%s: %s (total %.1f ms)' % (
+            self._name, ', '.join(['%s %.1f ms' % (phase, t * 1000)
+                                   for phase, t in self.phases]),
+            self.total() * 1000))
+
+
+def save(path=None):
+    ''' Write the recorded events as Chrome trace-event JSON '''
+    if path is None:
+        path = _path
+    if path is None:
+        return
+    try:
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, f)
+    except IOError as e:
+        logging.error('could not write trace %s: %s' % (path, e))
+
+
+if enabled:
+    atexit.register(save)
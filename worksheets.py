@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# worksheets.py
+"""
+    Copyright (C) 2014  Walter Bender
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Printable worksheets of the goal figures, without a display.
+
+    Usage:
+        python worksheets.py [--output PREFIX] [--formats pdf,svg,png]
+                             [--angle 90] [--length 5] [--size 160]
+                             [--jobs N] [--cache DIR]
+
+    PREFIX.pdf has one page per WORKSHEET_ROWS x WORKSHEET_COLUMNS
+    patterns, each figure with blank boxes for the numbers that draw
+    it. PREFIX-01.svg, PREFIX-02.svg, ... are the same pages as SVG.
+    PREFIX.png is a contact sheet of every figure.
+
+    The pages are vector drawings made directly. The contact sheet is
+    put together from PNG tiles kept in the cache directory: tiles are
+    drawn by a pool of worker processes, and only for goals that have
+    no tile at that size yet.
+
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+
+import cairo
+
+import spirocore
+from figures import draw_figure, TileCache
+
+PAGE = (595.28, 841.89)  # A4 in points
+MARGIN = 36
+WORKSHEET_COLUMNS = 3
+WORKSHEET_ROWS = 4
+SHEET_COLUMNS = 10  # tiles across the contact sheet
+CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'spirolaterals')
+
+
+def catalog(mode, path=spirocore.PATTERNS):
+    ''' [(pattern, goal)] for every pattern the mode offers '''
+    if mode.classic():
+        return [(i + 1, goal)
+                for i, goal in enumerate(spirocore.load_patterns(path))]
+    return [mode.get_goal(i) for i in range(1, spirocore.GENERATED + 1)]
+
+
+def draw_worksheet(cr, patterns, mode, width, height):
+    ''' One page: the figures with a box per number to fill in '''
+    cell_w = (width - 2 * MARGIN) / WORKSHEET_COLUMNS
+    cell_h = (height - 2 * MARGIN) / WORKSHEET_ROWS
+    label = 14
+    digit = min(24, cell_w * 0.8 / mode.length)
+    size = min(cell_w, cell_h - label - digit - 12) * 0.9
+    cr.select_font_face('Sans')
+    cr.set_font_size(11)
+    for n, (pattern, goal) in enumerate(patterns):
+        x = MARGIN + (n % WORKSHEET_COLUMNS) * cell_w + (cell_w - size) / 2
+        y = MARGIN + (n // WORKSHEET_COLUMNS) * cell_h
+        cr.set_source_rgb(0, 0, 0)
+        cr.move_to(x, y + 11)
+        cr.show_text('%d' % pattern)
+        y += label
+        cr.set_line_width(0.5)
+        cr.rectangle(x, y, size, size)
+        cr.set_source_rgb(0.6, 0.6, 0.6)
+        cr.stroke()
+        draw_figure(cr, goal, mode, x, y, size)
+        y += size + 6
+        left = x + (size - digit * mode.length) / 2
+        cr.set_source_rgb(0, 0, 0)
+        for i in range(mode.length):
+            cr.rectangle(left + i * digit + 2, y, digit - 4, digit - 4)
+        cr.stroke()
+
+
+def pages(patterns):
+    per_page = WORKSHEET_COLUMNS * WORKSHEET_ROWS
+    return [patterns[i:i + per_page]
+            for i in range(0, len(patterns), per_page)]
+
+
+def write_pdf(path, patterns, mode):
+    surface = cairo.PDFSurface(path, *PAGE)
+    cr = cairo.Context(surface)
+    for page in pages(patterns):
+        draw_worksheet(cr, page, mode, *PAGE)
+        cr.show_page()
+    surface.finish()
+
+
+def write_svgs(prefix, patterns, mode):
+    paths = []
+    for n, page in enumerate(pages(patterns)):
+        path = '%s-%02d.svg' % (prefix, n + 1)
+        surface = cairo.SVGSurface(path, *PAGE)
+        draw_worksheet(cairo.Context(surface), page, mode, *PAGE)
+        surface.finish()
+        paths.append(path)
+    return paths
+
+
+def _render(args):
+    directory, goal, angle, size = args
+    return TileCache(directory).render(goal, angle, size)
+
+
+def render_tiles(cache, goals, angle, size, jobs=None):
+    ''' Draw the missing tiles across a process pool; how many were drawn '''
+    missing = cache.missing(goals, angle, size)
+    work = [(cache.directory, goal, angle, size) for goal in missing]
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if jobs <= 1 or len(work) <= 1:
+        for args in work:
+            _render(args)
+    elif work:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            pool.map(_render, work)
+        finally:
+            pool.terminate()
+    return len(missing)
+
+
+def write_contact_sheet(path, patterns, mode, cache, size):
+    columns = min(SHEET_COLUMNS, len(patterns))
+    rows = (len(patterns) + columns - 1) // columns
+    gap = 4
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24,
+                                 columns * (size + gap) + gap,
+                                 rows * (size + gap) + gap)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(0.5, 0.5, 0.5)
+    cr.paint()
+    cr.select_font_face('Sans')
+    cr.set_font_size(max(8, size // 10))
+    for n, (pattern, goal) in enumerate(patterns):
+        x = gap + (n % columns) * (size + gap)
+        y = gap + (n // columns) * (size + gap)
+        cr.set_source_surface(cache.load(goal, mode.angle, size), x, y)
+        cr.paint()
+        cr.set_source_rgb(0.4, 0.4, 0.4)
+        cr.move_to(x + 3, y + max(8, size // 10) + 2)
+        cr.show_text('%d' % pattern)
+    surface.write_to_png(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Draw Spirolaterals worksheets and a contact sheet')
+    parser.add_argument('--output', default='worksheet',
+                        help='file name prefix (default: worksheet)')
+    parser.add_argument('--formats', default='pdf,svg,png',
+                        help='any of pdf, svg and png (default: all)')
+    parser.add_argument('--angle', type=int, default=spirocore.ANGLE,
+                        choices=spirocore.ANGLES)
+    parser.add_argument('--length', type=int, default=spirocore.DIGITS)
+    parser.add_argument('--size', type=int, default=160,
+                        help='contact sheet tile size in pixels')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--cache', default=CACHE,
+                        help='directory for the PNG tiles')
+    args = parser.parse_args(argv)
+
+    mode = spirocore.Mode(args.angle, min(max(
+        args.length, spirocore.MIN_DIGITS), spirocore.MAX_DIGITS))
+    patterns = catalog(mode)
+    formats = args.formats.split(',')
+    if 'pdf' in formats:
+        write_pdf(args.output + '.pdf', patterns, mode)
+        print('wrote %s.pdf' % args.output)
+    if 'svg' in formats:
+        paths = write_svgs(args.output, patterns, mode)
+        print('wrote %d SVG pages' % len(paths))
+    if 'png' in formats:
+        cache = TileCache(args.cache)
+        drawn = render_tiles(cache, [goal for pattern, goal in patterns],
+                             mode.angle, args.size, args.jobs)
+        write_contact_sheet(args.output + '.png', patterns, mode, cache,
+                            args.size)
+        print('wrote %s.png (%d of %d tiles drawn)' % (
+            args.output, drawn, len(patterns)))
+
+
+if __name__ == '__main__':
+    main()